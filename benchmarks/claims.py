@@ -0,0 +1,111 @@
+"""
+Checks ControllerClaims against real Postgres advisory locks: several workers in this process, each with its own
+claims pool and session, claim synthetic controllers as collector processes on different hosts would. Needs DB_URL
+(any Postgres database; nothing is written).
+
+    DB_URL=postgresql://... python -m benchmarks.claims [controllers] [workers]
+
+Asserts that every controller is collected exactly once, that workers leave as soon as all of them are done rather
+than at the deadline, that a worker started late finds the window closed, and that a dead worker's controllers are
+picked up by the others.
+"""
+import asyncio
+import sys
+import time
+import uuid
+from os import environ
+
+from domain.models import ControllerConfig
+from services.sharding import ControllerClaims
+
+DEADLINE = 20.0
+CALL_SECONDS = 0.1
+
+
+def synthetic_configs(count):
+    return [
+        ControllerConfig(
+            controller=f"controller-{n}", username="", password="", cacert="", owner_id=1,
+            uuid=str(uuid.uuid4()), endpoint="",
+        )
+        for n in range(count)
+    ]
+
+
+async def worker(db_url, name, configs, collected, start_skew=0.0, delay=0.0, hang=None):
+    """
+    Runs one worker with concurrency 2 and returns how long it took. A controller in `hang` never completes.
+    """
+    await asyncio.sleep(delay)
+    claims = ControllerClaims(db_url, 3600, poll_interval=0.05)
+    claims.start_skew = start_skew
+
+    async def run_one(config):
+        if hang is not None and config.uuid in hang:
+            await asyncio.Event().wait()
+        await asyncio.sleep(CALL_SECONDS)
+        collected.append((name, config.uuid))
+        return config.uuid
+
+    started = time.monotonic()
+    try:
+        async with claims:
+            await claims.run(configs, run_one, 2, time.monotonic() + DEADLINE)
+    finally:
+        await claims.close()
+    return time.monotonic() - started
+
+
+def assert_once(configs, collected):
+    uuids = sorted(uuid for _, uuid in collected)
+    assert uuids == sorted(config.uuid for config in configs), f"expected every controller once, got {uuids}"
+
+
+async def check_claims(db_url, count, workers):
+    configs = synthetic_configs(count)
+    collected = []
+    elapsed = await asyncio.gather(*(worker(db_url, f"w{n}", configs, collected) for n in range(workers)))
+    assert_once(configs, collected)
+    assert max(elapsed) < DEADLINE / 2, f"workers waited for the deadline: {elapsed}"
+    print(f"{workers} workers, {count} controllers: collected once each, slowest worker {max(elapsed):.2f}s")
+
+
+async def check_late_worker(db_url, count, workers):
+    configs = synthetic_configs(count)
+    collected = []
+    # The window stays closed until 2s from now; the late worker starts after the others have finished.
+    skew = time.time() % 3600 + 2.0
+    tasks = [worker(db_url, f"w{n}", configs, collected, skew) for n in range(workers)]
+    tasks.append(worker(db_url, "late", configs, collected, skew, delay=1.0))
+    await asyncio.gather(*tasks)
+    assert_once(configs, collected)
+    assert all(name != "late" for name, _ in collected), "the late worker collected again"
+    print("late worker: found the window closed")
+
+
+async def check_dead_worker(db_url, count, workers):
+    configs = synthetic_configs(count)
+    collected = []
+    dying = asyncio.create_task(worker(db_url, "dying", configs, collected, hang={config.uuid for config in configs}))
+    await asyncio.sleep(0.5)
+    others = [asyncio.create_task(worker(db_url, f"w{n}", configs, collected)) for n in range(workers - 1)]
+    await asyncio.sleep(0.5)
+    dying.cancel()
+    await asyncio.gather(dying, return_exceptions=True)
+    await asyncio.gather(*others)
+    assert_once(configs, collected)
+    assert all(name != "dying" for name, _ in collected)
+    print("dead worker: its controllers were picked up by the others")
+
+
+async def main(count, workers):
+    db_url = environ.get("DB_URL")
+    if not db_url:
+        sys.exit("DB_URL is required")
+    await check_claims(db_url, count, workers)
+    await check_late_worker(db_url, count, workers)
+    await check_dead_worker(db_url, count, max(2, workers))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 12, int(sys.argv[2]) if len(sys.argv) > 2 else 3))
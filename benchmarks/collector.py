@@ -0,0 +1,168 @@
+"""
+End-to-end collector benchmark: CollectorService and ModelReader against a FakeController serving synthetic models,
+written through one of the writers. Database writers need DB_URL (a database with the collector schema); their
+transaction is rolled back instead of finalized, so nothing is ingested.
+
+    python -m benchmarks.collector --models 200 --applications 10 --units 3 --machines 20 --writers none,bulk,row,copy
+
+Reports models/s, rows/s, DB round trips and peak RSS. Each writer runs in its own process so peak RSS is per writer.
+"""
+import argparse
+import asyncio
+import logging
+import resource
+import subprocess
+import sys
+import time
+from os import environ
+
+from benchmarks.fake_juju import FakeController, FakeControllers, SyntheticSpec
+from domain.models import ControllerConfig
+from services.collector_service import CollectorService
+from util.metrics import metrics
+from writers import ConsoleWriter
+
+WRITERS = ("none", "console", "row", "bulk", "json", "copy")
+
+
+class NullWriter:
+    async def prepare_controller(self, controller):
+        return None
+
+    async def write_model(self, model):
+        return None
+
+    async def write_unreachable_model(self, model_id):
+        return None
+
+    async def write_unchanged_model(self, model_id):
+        return None
+
+    async def start_model(self):
+        return None
+
+    async def commit_model(self):
+        return None
+
+    async def rollback_model(self):
+        return None
+
+    async def finalize_controller(self):
+        return None
+
+    async def close(self):
+        return None
+
+
+class RollbackOnFinalize:
+    """
+    Wraps a database writer so finalize flushes anything buffered and then rolls back instead of calling insert_juju_data.
+    """
+    def __init__(self, writer):
+        self.writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    async def finalize_controller(self):
+        if hasattr(self.writer, "flush"):
+            await self.writer.flush()
+        await self.writer.flush_repopulate()
+        await self.writer.dbm.rollback()
+
+
+class BenchCollectorService(CollectorService):
+    async def _list_models(self, controller):
+        return list(controller.models)
+
+
+async def make_writer(name, owner_id):
+    if name == "none":
+        return NullWriter()
+    if name == "console":
+        return ConsoleWriter()
+
+    from util.connection_util import connect_to_db
+    from writers import CopyWriter, DatabaseWriter
+
+    db_url = environ.get("DB_URL")
+    if not db_url:
+        raise SystemExit(f"DB_URL is required for the {name} writer")
+    dbm, entry_id = await connect_to_db(db_url, owner_id)
+    writer = CopyWriter(dbm, entry_id) if name == "copy" else DatabaseWriter(dbm, entry_id, write_mode=name)
+    return RollbackOnFinalize(writer)
+
+
+async def run(args):
+    spec = SyntheticSpec(
+        models=args.models,
+        applications=args.applications,
+        units=args.units,
+        machines=args.machines,
+        preferred_ratio=args.preferred_ratio,
+        ipv6_ratio=args.ipv6_ratio,
+        latency=args.latency,
+        congestion=args.congestion,
+        seed=args.seed,
+    )
+    controller = FakeController(spec)
+    config = ControllerConfig(
+        controller="bench", username="admin", password="", cacert="", owner_id=args.owner_id,
+        uuid="00000000-0000-0000-0000-000000000000", endpoint="localhost:17070",
+    )
+    service = BenchCollectorService(model_concurrency=args.concurrency, model_reader="full")
+    writer = await make_writer(args.writers, args.owner_id)
+
+    metrics.reset()
+    started = time.perf_counter()
+    await service.run(config, writer, FakeControllers(controller))
+    elapsed = time.perf_counter() - started
+
+    rows = sum(value for (name, _), value in metrics.counters.items() if name == "rows_written_total")
+    statements = sum(value for (name, _), value in metrics.counters.items() if name == "db_statements_total")
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{args.writers:<8} {spec.models} models in {elapsed:7.3f}s: {spec.models / elapsed:9.1f} models/s, "
+        f"{rows / elapsed:11.1f} rows/s, {statements:.0f} DB round trips, peak RSS {peak_rss:.1f} MiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", type=int, default=100)
+    parser.add_argument("--applications", type=int, default=10)
+    parser.add_argument("--units", type=int, default=3)
+    parser.add_argument("--machines", type=int, default=20)
+    parser.add_argument("--preferred-ratio", type=float, default=0.5)
+    parser.add_argument("--ipv6-ratio", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated get_model latency in seconds")
+    parser.add_argument(
+        "--congestion", type=float, default=0.0, help="extra get_model latency in seconds per call already in flight"
+    )
+    parser.add_argument("--concurrency", type=int, default=1, help="MODEL_CONCURRENCY for the run")
+    parser.add_argument("--owner-id", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--writers", default="none", help=f"comma-separated, from {', '.join(WRITERS)}")
+    args = parser.parse_args()
+
+    writers = [name.strip() for name in args.writers.split(",") if name.strip()]
+    unknown = set(writers) - set(WRITERS)
+    if unknown:
+        parser.error(f"unknown writer(s): {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.WARNING)
+    if len(writers) == 1:
+        asyncio.run(run(args))
+        return
+
+    for name in writers:
+        argv = [arg for arg in sys.argv[1:]]
+        index = argv.index("--writers") if "--writers" in argv else None
+        if index is not None:
+            del argv[index:index + 2]
+        argv = [a for a in argv if not a.startswith("--writers=")]
+        subprocess.run([sys.executable, "-m", "benchmarks.collector", *argv, "--writers", name], check=False)
+
+
+if __name__ == "__main__":
+    main()
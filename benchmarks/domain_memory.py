@@ -0,0 +1,99 @@
+"""
+Memory benchmark of the slotted, interned domain models against the previous plain frozen dataclasses.
+
+    python -m benchmarks.domain_memory [units]
+"""
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from domain import models
+
+
+@dataclass(frozen=True)
+class LegacyMachine:
+    ordinal: int
+    ip: Optional[str]
+    instance_id: str
+
+
+@dataclass(frozen=True)
+class LegacyUnit:
+    ordinal: int
+    name: str
+    machine_instance_id: str
+
+
+@dataclass(frozen=True)
+class LegacyApplication:
+    name: str
+    charm: str
+    subordinate: bool
+    units: List[LegacyUnit] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class LegacyModel:
+    uuid: str
+    name: str
+    owner: str
+    controller_uuid: str
+    cloud: str
+    applications: List[LegacyApplication] = field(default_factory=list)
+    machines: Dict[str, LegacyMachine] = field(default_factory=dict)
+
+
+def build(total_units, Machine, Unit, Application, Model, units_per_app=5, apps_per_model=20, machines_per_model=50):
+    """
+    Builds models the way the readers do: every string comes from a fresh decode (as from a websocket), not a literal.
+    """
+    built = []
+    units_left = total_units
+    index = 0
+    while units_left > 0:
+        uuid = f"{index:08x}-0000-0000-0000-000000000000"
+        machines = {}
+        for ordinal in range(machines_per_model):
+            instance_id = f"juju-{index:06x}-{ordinal}".encode().decode()
+            machines[instance_id] = Machine(ordinal, f"10.{index % 256}.{ordinal}.1".encode().decode(), instance_id)
+        instance_ids = list(machines)
+        applications = []
+        for app_index in range(apps_per_model):
+            units = []
+            for ordinal in range(min(units_per_app, units_left)):
+                units.append(Unit(
+                    ordinal,
+                    f"app-{app_index}/{ordinal}".encode().decode(),
+                    instance_ids[(app_index + ordinal) % len(instance_ids)].encode().decode(),
+                ))
+                units_left -= 1
+            applications.append(Application(
+                f"app-{app_index}".encode().decode(), f"charm-{app_index % 7}".encode().decode(), False, units
+            ))
+        built.append(Model(
+            uuid, f"model-{index}", "admin".encode().decode(), "controller".encode().decode(),
+            "localhost".encode().decode(), applications, machines,
+        ))
+        index += 1
+    return built
+
+
+def measure(total_units, *classes):
+    tracemalloc.start()
+    built = build(total_units, *classes)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    return size
+
+
+def main(total_units=50_000):
+    legacy = measure(total_units, LegacyMachine, LegacyUnit, LegacyApplication, LegacyModel)
+    compact = measure(total_units, models.Machine, models.Unit, models.Application, models.Model)
+    print(f"legacy  {total_units} units: {legacy / 2**20:7.1f} MiB")
+    print(f"compact {total_units} units: {compact / 2**20:7.1f} MiB ({100 * (1 - compact / legacy):.0f}% less)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,151 @@
+"""
+A stand-in for a python-libjuju Controller that serves synthetic models from memory, with optional simulated latency.
+It implements only what CollectorService and ModelReader touch.
+"""
+import asyncio
+import random
+import uuid
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Dict, List
+
+
+@dataclass
+class SyntheticSpec:
+    models: int = 100
+    applications: int = 10
+    units: int = 3
+    machines: int = 20
+    preferred_ratio: float = 0.5
+    ipv6_ratio: float = 0.3
+    latency: float = 0.0
+    # Extra get_model latency per call already in flight, to simulate a controller that slows down under load.
+    congestion: float = 0.0
+    seed: int = 0
+
+
+@dataclass
+class FakeMachine:
+    id: str
+    instance_id: str
+    addresses: List[Dict[str, str]] = field(default_factory=list)
+
+
+@dataclass
+class FakeUnit:
+    name: str
+    machine: FakeMachine
+    public_address: str
+
+
+@dataclass
+class FakeApplication:
+    name: str
+    charm_name: str
+    subordinate: bool
+    units: List[FakeUnit] = field(default_factory=list)
+
+
+class FakeModel:
+    def __init__(self, info, applications: Dict[str, FakeApplication]):
+        self.info = info
+        self.applications = applications
+
+    def is_connected(self):
+        return True
+
+    async def disconnect(self):
+        return None
+
+
+def _addresses(rng: random.Random, spec: SyntheticSpec):
+    addresses = [
+        {"value": f"172.17.{rng.randrange(256)}.{rng.randrange(256)}", "scope": "local-cloud", "type": "ipv4"},
+        {"value": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}", "scope": "local-cloud", "type": "ipv4"},
+        {"value": "127.0.0.1", "scope": "local-machine", "type": "ipv4"},
+    ]
+    if rng.random() < spec.preferred_ratio:
+        addresses.append({"value": f"192.168.{rng.randrange(256)}.{rng.randrange(256)}", "scope": "local-cloud", "type": "ipv4"})
+    if rng.random() < spec.ipv6_ratio:
+        addresses.append({"value": f"fd00::{rng.randrange(65536):x}", "scope": "local-cloud", "type": "ipv6"})
+    rng.shuffle(addresses)
+    return addresses
+
+
+def synthetic_model(model_uuid: str, index: int, spec: SyntheticSpec, rng: random.Random) -> FakeModel:
+    machines = [
+        FakeMachine(id=str(ordinal), instance_id=f"juju-{model_uuid[:6]}-{ordinal}", addresses=_addresses(rng, spec))
+        for ordinal in range(max(1, spec.machines))
+    ]
+    applications = {}
+    for app_index in range(spec.applications):
+        name = f"app-{app_index}"
+        units = [
+            FakeUnit(
+                name=f"{name}/{ordinal}",
+                machine=machines[(app_index * spec.units + ordinal) % len(machines)],
+                public_address=f"203.0.113.{rng.randrange(256)}",
+            )
+            for ordinal in range(spec.units)
+        ]
+        applications[name] = FakeApplication(
+            name=name, charm_name=f"charm-{app_index % 7}", subordinate=app_index % 5 == 4, units=units
+        )
+    info = SimpleNamespace(
+        uuid=model_uuid,
+        name=f"model-{index}",
+        owner_tag="user-admin",
+        cloud_tag="cloud-localhost",
+        provider_type="lxd",
+    )
+    return FakeModel(info, applications)
+
+
+class FakeController:
+    def __init__(self, spec: SyntheticSpec):
+        self.spec = spec
+        rng = random.Random(spec.seed)
+        self.models = {}
+        self.in_flight = 0
+        for index in range(spec.models):
+            model_uuid = str(uuid.UUID(int=rng.getrandbits(128)))
+            self.models[model_uuid] = synthetic_model(model_uuid, index, spec, rng)
+
+    async def get_model(self, model_uuid: str):
+        self.in_flight += 1
+        try:
+            if self.spec.latency or self.spec.congestion:
+                await asyncio.sleep(self.spec.latency + self.spec.congestion * (self.in_flight - 1))
+        finally:
+            self.in_flight -= 1
+        return self.models[model_uuid]
+
+    async def clouds(self):
+        return SimpleNamespace(clouds={"cloud-localhost": None})
+
+    def get_current_username(self):
+        return "admin"
+
+    def is_connected(self):
+        return True
+
+    async def disconnect(self):
+        return None
+
+
+class FakeControllers:
+    """
+    A ControllerConnections stand-in that always hands out the same FakeController.
+    """
+    def __init__(self, controller: FakeController, models=None):
+        self.controller = controller
+        self.models = models
+
+    async def get(self, controller_config):
+        return self.controller
+
+    async def discard(self, controller_config):
+        return None
+
+    async def close(self):
+        return None
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark of IpPolicy.select against the previous per-call ModelReader.machine_ip logic.
+
+    python -m benchmarks.ip_policy [machines]
+"""
+import random
+import sys
+import timeit
+from os import environ
+
+from readers.ip_policy import IpPolicy
+
+
+def legacy_machine_ip(addresses, public_address):
+    permitted_scopes = environ.get("PERMITTED_IP_SCOPES") or ["local-cloud"]
+    permitted_types = environ.get("PERMITTED_IP_TYPES") or ["ipv4"]
+    values = [a["value"] for a in addresses if a["scope"] in permitted_scopes and a["type"] in permitted_types]
+    preferred = [a for a in values if a.startswith(environ.get("PREFERRED_IP_PREFIX") or "192.168")]
+    permissible = [a for a in values if not a.startswith(environ.get("BANNED_IP_PREFIX") or "172.17")]
+    return preferred[0] if preferred else permissible[0] if permissible else public_address
+
+
+def synthetic_addresses(count, seed=0):
+    rng = random.Random(seed)
+    machines = []
+    for _ in range(count):
+        addresses = [
+            {"value": f"172.17.{rng.randrange(256)}.{rng.randrange(256)}", "scope": "local-cloud", "type": "ipv4"},
+            {"value": f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}", "scope": "local-cloud", "type": "ipv4"},
+            {"value": "fe80::1", "scope": "link-local", "type": "ipv6"},
+            {"value": "127.0.0.1", "scope": "local-machine", "type": "ipv4"},
+        ]
+        if rng.random() < 0.5:
+            addresses.append({"value": f"192.168.{rng.randrange(256)}.{rng.randrange(256)}", "scope": "local-cloud", "type": "ipv4"})
+        rng.shuffle(addresses)
+        machines.append(addresses)
+    return machines
+
+
+def main(count=100_000):
+    machines = synthetic_addresses(count)
+    prefix_policy = IpPolicy.from_env()
+    cidr_policy = IpPolicy(preferred=["192.168.0.0/16"], banned=["172.17.0.0/16"])
+
+    assert [legacy_machine_ip(m, None) for m in machines] == [prefix_policy.select(m) for m in machines]
+    assert [legacy_machine_ip(m, None) for m in machines] == [cidr_policy.select(m) for m in machines]
+
+    # Without preferred ranges (e.g. PREFERRED_IP_PREFIX=","), the first permitted address outside the banned ranges wins.
+    no_preferred = IpPolicy(preferred=())
+    assert no_preferred.select([{"value": "10.0.0.1", "scope": "local-cloud", "type": "ipv4"}], "pub") == "10.0.0.1"
+    assert [no_preferred.select(m) for m in machines] == [
+        next((a["value"] for a in m if a["scope"] == "local-cloud" and a["type"] == "ipv4" and not a["value"].startswith("172.17")), None)
+        for m in machines
+    ]
+
+    for name, fn in [
+        ("legacy", lambda: [legacy_machine_ip(m, None) for m in machines]),
+        ("IpPolicy (prefix)", lambda: [prefix_policy.select(m) for m in machines]),
+        ("IpPolicy (cidr)", lambda: [cidr_policy.select(m) for m in machines]),
+    ]:
+        best = min(timeit.repeat(fn, number=1, repeat=5))
+        print(f"{name:<20} {count} machines: {best * 1000:8.1f} ms ({count / best:,.0f} machines/s)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import os
+import random
+import signal
+import time
+
+from os import environ
+
+from util.connection_util import ControllerConnections, ModelConnections, connect_to_db
+from util.deadline import current_deadline
+from util.metrics import metrics
+from util.profiling import Profiler
+from util.resources import ResourceMonitor
+from readers.config_reader import ConfigError, ConfigReader
+from services.collector_service import CollectorService
+from services.scheduler import Scheduler
+from services.sharding import ControllerClaims, launch, select_shard
+from services.watch_service import WatchService
+from writers import ConsoleWriter, SnapshotWriter, writer_kind
+
+logger = logging.getLogger(__name__)
+
+
+# The database driver is only imported by the two helpers below, so that collecting to the console or to snapshots
+# never loads it.
+def create_database(db_url, concurrency=None):
+    """
+    A database pool for `db_url`, not yet connected, sized for `concurrency` controllers writing at once.
+    """
+    from db.database_manager import DatabaseManager
+    return DatabaseManager.create_database(db_url, concurrency=concurrency)
+
+
+async def open_database_writer(db_url, owner_id, database=None):
+    """
+    A DB manager with a new entry for `owner_id` and the writer selected by DB_WRITE_MODE for it.
+    """
+    from writers import make_database_writer
+    dbm, entry_id = await connect_to_db(db_url, owner_id, database)
+    return dbm, make_database_writer(dbm, entry_id)
+
+
+async def run_controller(service, db_url, controller_config, database=None, controllers=None, deadline=None):
+    """
+    Runs a single controller end to end with its own DB manager, connection, transaction and entry, taken from
+    the shared `database` pool when one is given. Model reads stop at `deadline` (a time.monotonic()), after which
+    the run finalizes what it has. Failures are logged and reported in the returned outcome, never raised.
+    """
+    started = time.monotonic()
+    outcome = "ok"
+    status = "ok"
+    dbm = None
+    current_deadline.set(deadline)
+    try:
+        kind = writer_kind()
+        if kind == "snapshot":
+            writer = SnapshotWriter(controller_config.owner_id)
+        elif kind == "console":
+            writer = ConsoleWriter()
+        else:
+            dbm, writer = await open_database_writer(db_url, controller_config.owner_id, database)
+        if not await service.run(controller_config, writer, controllers):
+            outcome = "not finalized"
+            status = "failed"
+    except asyncio.CancelledError:
+        outcome = status = "cancelled"
+        metrics.record_controller(controller_config.controller, status, time.monotonic() - started)
+        raise
+    except Exception as e:
+        outcome = f"failed ({type(e).__name__})"
+        status = "failed"
+        logger.exception(
+            "Controller run failed for %s %s", controller_config.controller, controller_config.endpoint
+        )
+    finally:
+        if dbm:
+            await dbm.disconnect()
+    elapsed = time.monotonic() - started
+    metrics.record_controller(controller_config.controller, status, elapsed)
+    return controller_config.controller, outcome, elapsed
+
+
+async def run_all(service, db_url, configs, database=None, controllers=None, scheduler=None, budget=None, claims=None):
+    """
+    Runs every controller once, fastest first, within `budget` seconds (see Scheduler). With `claims`
+    (a ControllerClaims) only the controllers this process manages to claim are run.
+    """
+    concurrency = max(1, int(environ.get("CONTROLLER_CONCURRENCY", "1")))
+    semaphore = asyncio.Semaphore(concurrency)
+    scheduler = scheduler or Scheduler()
+    deadline = scheduler.deadline(budget)
+
+    async def bounded(controller_config):
+        name = controller_config.controller
+        open_until = scheduler.open_until(controller_config)
+        if open_until:
+            metrics.record_controller(name, "skipped", 0.0)
+            return name, f"skipped (circuit open until {time.strftime('%H:%M:%S', time.localtime(open_until))})", 0.0
+        async with semaphore:
+            if deadline is not None and time.monotonic() >= deadline:
+                metrics.record_controller(name, "deferred", 0.0)
+                return name, "deferred (deadline reached)", 0.0
+            started = time.monotonic()
+            try:
+                result = await run_controller(service, db_url, controller_config, database, controllers, deadline)
+            except asyncio.CancelledError:
+                scheduler.record(controller_config, False, time.monotonic() - started)
+                raise
+        scheduler.record(controller_config, result[1] == "ok", result[2])
+        return result
+
+    logger.info("Running %d controller(s) with concurrency %d", len(configs), concurrency)
+    metrics.reset()
+    if database is not None:
+        database.clear_versions()
+    monitor = ResourceMonitor()
+    monitor.start()
+    try:
+        if claims is None:
+            results = await asyncio.gather(*(
+                asyncio.create_task(bounded(config), name=f"controller {config.controller}")
+                for config in scheduler.order(configs)
+            ))
+        else:
+            async with claims:
+                results = await claims.run(scheduler.order(configs), bounded, concurrency, deadline)
+    finally:
+        await monitor.stop()
+        export_metrics()
+        scheduler.save()
+
+    for name, outcome, elapsed in results:
+        logger.info("Controller %s: %s in %.2fs", name, outcome, elapsed)
+
+
+def export_metrics():
+    try:
+        metrics.export(environ.get("METRICS_TEXTFILE"), environ.get("METRICS_REPORT"))
+    except OSError:
+        logger.exception("Failed to export run metrics")
+
+
+def stop_on_signals():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    return stop
+
+
+async def daemon(service, db_url, configs, interval, jitter, cycle_timeout, claim=False):
+    """
+    Re-runs every controller each `interval` seconds (plus up to `jitter` seconds) over one shared DB pool and
+    persistent controller connections, which are re-established on the next cycle if they drop. With
+    MODEL_POOL_SIZE, up to that many model connections are kept open between cycles too. With `claim`,
+    cycles start on multiples of `interval` so that every worker claims controllers in the same window, and
+    a cycle is bounded by `interval` as well as `cycle_timeout`, so that it never runs into the next window.
+    Stops on SIGTERM/SIGINT.
+    """
+    stop = stop_on_signals()
+    database = create_database(db_url) if writer_kind() == "database" else None
+    controllers = ControllerConnections(ModelConnections.from_env())
+    claims = ControllerClaims(db_url, interval) if claim else None
+    if claim:
+        cycle_timeout = min(cycle_timeout, interval) if cycle_timeout else interval
+    scheduler = Scheduler()
+    try:
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                if database is not None and not database.is_connected:
+                    await database.connect()
+                await asyncio.wait_for(
+                    run_all(service, db_url, configs, database, controllers, scheduler, cycle_timeout, claims),
+                    timeout=cycle_timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.error("Collection cycle exceeded %ss and was cancelled", cycle_timeout)
+            except Exception:
+                logger.exception("Collection cycle failed")
+            elapsed = time.monotonic() - started
+            if claim:
+                delay = interval - time.time() % interval
+            else:
+                delay = max(0.0, interval - elapsed) + random.uniform(0, jitter)
+            logger.info("Cycle took %.2fs, next in %.2fs", elapsed, delay)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await controllers.close()
+        if claims is not None:
+            await claims.close()
+        if database is not None and database.is_connected:
+            await database.disconnect()
+
+
+async def watch(db_url, configs):
+    """
+    Event-driven mode: watches every controller's models and writes only changed models (see WatchService).
+    Stops on SIGTERM/SIGINT.
+    """
+    stop = stop_on_signals()
+    service = WatchService()
+    # Every controller is watched, and may flush, at once, whatever CONTROLLER_CONCURRENCY says.
+    database = create_database(db_url, concurrency=len(configs))
+    await database.connect()
+    controllers = ControllerConnections()
+
+    def writer_factory(controller_config):
+        async def make():
+            _, writer = await open_database_writer(db_url, controller_config.owner_id, database)
+            return writer
+        return make
+
+    exporter = asyncio.create_task(export_every(service.flush_interval, stop), name="metrics exporter")
+    try:
+        await asyncio.gather(
+            *(service.watch(config, writer_factory(config), controllers, stop) for config in configs)
+        )
+    finally:
+        await controllers.close()
+        await database.disconnect()
+        # The last interval is exported once the connections are closed, so its open sockets show any leak.
+        stop.set()
+        await exporter
+
+
+async def export_every(interval, stop):
+    """
+    Exports and then resets the metrics every `interval` seconds, and once more when `stop` is set, so that the
+    long-lived watch mode reports per interval and its per-model records do not grow without bound. Resources are
+    monitored per interval, as per run_all run.
+    """
+    while True:
+        monitor = ResourceMonitor()
+        monitor.start()
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await monitor.stop()
+            export_metrics()
+            metrics.reset()
+        if stop.is_set():
+            return
+
+
+async def collect(daemon_interval=0, cycle_timeout=None, shard=None, claim=False) -> int:
+    """
+    Collects as configured by the environment. Returns the exit code: 1 when the configuration is unusable.
+    """
+    config_path = environ.get("CONFIG_PATH", "config.yaml")
+    try:
+        configs = ConfigReader.load_config(config_path)
+    except FileNotFoundError:
+        logger.error("Config file %s not found.", config_path)
+        return 1
+    except ConfigError as e:
+        logger.error("%s", e)
+        return 1
+
+    if not configs:
+        logger.error("No controllers configured in %s", config_path)
+        return 1
+
+    if shard:
+        configs = select_shard(configs, *shard)
+        logger.info("Shard %d/%d: %d controller(s)", shard[0], shard[1], len(configs))
+
+    db_url = environ.get("DB_URL")
+    if not db_url and (writer_kind() == "database" or environ.get("COLLECT_MODE") == "watch" or claim):
+        logger.error("Database configuration is missing in environment variables.")
+        return 1
+
+    if (shard or claim) and environ.get("FINGERPRINT_STATE_DIR"):
+        # Fingerprints are kept per host, so they go stale when a controller can be collected elsewhere in between.
+        logger.warning("Ignoring FINGERPRINT_STATE_DIR: fingerprints are per host and do not work with --shard or --claim")
+        environ.pop("FINGERPRINT_STATE_DIR")
+
+    if environ.get("COLLECT_MODE") == "watch":
+        await watch(db_url, configs)
+        return 0
+
+    service = CollectorService()
+    if daemon_interval > 0:
+        jitter = float(environ.get("DAEMON_JITTER", str(daemon_interval / 10)))
+        await daemon(service, db_url, configs, daemon_interval, jitter, cycle_timeout, claim)
+    else:
+        database = create_database(db_url) if writer_kind() == "database" else None
+        # Single runs are claimed per period of the schedule that starts them, APP_TIMEOUT unless CLAIM_WINDOW is set.
+        claims = ControllerClaims(db_url, environ.get("CLAIM_WINDOW") or cycle_timeout or 600) if claim else None
+        try:
+            if database is not None:
+                await database.connect()
+            await run_all(service, db_url, configs, database, budget=cycle_timeout, claims=claims)
+        finally:
+            if claims is not None:
+                await claims.close()
+            if database is not None and database.is_connected:
+                await database.disconnect()
+    return 0
+
+
+def run(shard=None, claim=False, processes=1, profile=None) -> int:
+    """
+    Runs a collection as configured by the environment, with `processes` collector processes (0 for one per CPU
+    core) and, with `profile`, profiling into that directory. Returns the exit code.
+    """
+    if processes != 1:
+        if profile:
+            environ["PROFILE_DIR"] = profile
+        return launch(processes or os.cpu_count() or 1, shard, claim)
+
+    profiler = Profiler.from_options(profile)
+    if profiler:
+        profiler.start()
+    timeout = int(environ.get("APP_TIMEOUT", "600"))
+    try:
+        interval = float(environ.get("DAEMON_INTERVAL", "0"))
+        if interval > 0 or environ.get("COLLECT_MODE") == "watch":
+            main = collect(daemon_interval=interval, cycle_timeout=timeout, shard=shard, claim=claim)
+        else:
+            # collect() finalizes before the timeout (see Scheduler); wait_for is the backstop for anything that hangs.
+            main = asyncio.wait_for(collect(cycle_timeout=timeout, shard=shard, claim=claim), timeout=timeout)
+        return asyncio.run(profiler.run(main) if profiler else main)
+    except asyncio.TimeoutError:
+        print(f"Application closed due to timeout {timeout}s.")
+        return 1
+    finally:
+        if profiler:
+            profiler.stop()
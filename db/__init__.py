@@ -1,23 +1,47 @@
 from db.repository import (
+    copy_records,
+    ingest_juju_model,
     insert_application,
+    insert_applications,
     insert_clouds,
     insert_controller,
     insert_juju_data,
     insert_machine,
+    insert_machines,
     insert_model,
     insert_unit,
+    insert_units,
     populate_unreachable_model,
+    populate_unreachable_models,
+    advisory_lock,
+    release_advisory_lock,
+    release_advisory_locks,
+    resolve_staged_units,
     setup_juju_temp_tables_v1,
+    setup_unit_stage,
+    try_advisory_lock,
 )
 
 __all__ = [
+    "copy_records",
+    "ingest_juju_model",
     "insert_application",
+    "insert_applications",
     "insert_clouds",
     "insert_controller",
     "insert_juju_data",
     "insert_machine",
+    "insert_machines",
     "insert_model",
     "insert_unit",
+    "insert_units",
     "populate_unreachable_model",
+    "populate_unreachable_models",
+    "advisory_lock",
+    "release_advisory_lock",
+    "release_advisory_locks",
+    "resolve_staged_units",
     "setup_juju_temp_tables_v1",
+    "setup_unit_stage",
+    "try_advisory_lock",
 ]
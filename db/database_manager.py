@@ -1,45 +1,98 @@
+import time
 from os import environ
-from databases import Database
+from databases import Database, DatabaseURL
 from logging import getLogger, DEBUG
 
+from util.metrics import metrics, statement_label
+
 class QueryDumper(Database):
-    """ A primitive database wrapper that logs all queries and responses."""
-    def __init__(self, *args, **wqargs):
+    """ A database wrapper that times every statement into the run metrics and, when recording, logs queries and responses."""
+    def __init__(self, *args, log_queries=True, **wqargs):
         super().__init__(*args, **wqargs)
+        self.log_queries = log_queries
         self.logger = getLogger("Database")
-        self.logger.setLevel(DEBUG)
+        # component -> supported versions, shared by every DatabaseManager on this pool until clear_versions().
+        self.versions = {}
+        if log_queries:
+            self.logger.setLevel(DEBUG)
 
-    async def execute(self, *args, **kwargs):
-        ret = await super().execute(*args, **kwargs)
-        self.logger.debug(f"execute({args}, {kwargs}) -> {ret}")
-        return ret
-    
-    async def fetch_all(self, *args, **kwargs):
-        ret = await super().fetch_all(*args, **kwargs)
-        self.logger.debug(f"fetch_all({args}, {kwargs}) -> {ret}")
-        return ret
-    
-    async def fetch_one(self, *args, **kwargs):
-        ret = await super().fetch_one(*args, **kwargs)
-        self.logger.debug(f"fetch_one({args}, {kwargs}) -> {ret}")
+    async def _timed(self, method, name, query, *args, **kwargs):
+        statement = statement_label(query)
+        started = time.perf_counter()
+        try:
+            ret = await method(query, *args, **kwargs)
+        except Exception:
+            metrics.inc("db_errors_total", statement=statement)
+            raise
+        finally:
+            metrics.inc("db_statements_total", statement=statement)
+            metrics.observe("db_statement_seconds", time.perf_counter() - started, statement=statement)
+        if self.log_queries:
+            self.logger.debug(f"{name}({(query, *args)}, {kwargs}) -> {ret}")
         return ret
 
+    def clear_versions(self):
+        self.versions.clear()
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(super().execute, "execute", query, *args, **kwargs)
+
+    async def execute_many(self, query, *args, **kwargs):
+        return await self._timed(super().execute_many, "execute_many", query, *args, **kwargs)
+
+    async def fetch_all(self, query, *args, **kwargs):
+        return await self._timed(super().fetch_all, "fetch_all", query, *args, **kwargs)
+
+    async def fetch_one(self, query, *args, **kwargs):
+        return await self._timed(super().fetch_one, "fetch_one", query, *args, **kwargs)
+
 class DatabaseManager:
-    def __init__(self, db_url=None, owner=None, record=False):
+    def __init__(self, db_url=None, owner=None, record=False, database=None):
+        """
+        When a connected `database` is given (see create_database) its pool is shared: this manager takes
+        a connection and transaction from it for the current task and leaves the pool open on disconnect.
+        """
         self.logger = getLogger("DatabaseManager")
-        if not db_url or not owner:
+        if not (db_url or database) or not owner:
             raise ValueError("Database configuration is missing.")
-        if record or environ.get("RECORD_QUERIES"):
-            self.logger.info("Recording queries")
-            self.db = QueryDumper(db_url)
-        else:
-            self.db = Database(db_url)
+        self.shared = database is not None
+        self.db = database if self.shared else self.create_database(db_url, record)
         self.owner_id = int(owner)
         self.entry = None
         self.transaction = None
+        self.savepoint = None
+
+    @staticmethod
+    def create_database(db_url, record=False, concurrency=None):
+        record = bool(record or environ.get("RECORD_QUERIES"))
+        if record:
+            getLogger("DatabaseManager").info("Recording queries")
+        return QueryDumper(db_url, log_queries=record, **DatabaseManager.pool_options(db_url, concurrency))
+
+    @staticmethod
+    def pool_options(db_url, concurrency=None):
+        """
+        asyncpg pool settings from DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE and DB_STATEMENT_CACHE_SIZE. asyncpg prepares
+        every statement once per connection and reuses it by query text, so with one long-lived pool the repository's
+        fixed statements are parsed once per pooled connection rather than once per controller. Other backends get none.
+        The pool holds `concurrency` connections (default: CONTROLLER_CONCURRENCY) unless DB_POOL_MAX_SIZE is set.
+        """
+        url = DatabaseURL(db_url)
+        if url.dialect not in ("postgres", "postgresql") or url.driver not in ("", "asyncpg"):
+            return {}
+        concurrency = max(1, concurrency or int(environ.get("CONTROLLER_CONCURRENCY", "1")))
+        options = {
+            "min_size": int(environ.get("DB_POOL_MIN_SIZE", "1")),
+            "max_size": int(environ.get("DB_POOL_MAX_SIZE", str(concurrency))),
+        }
+        if environ.get("DB_STATEMENT_CACHE_SIZE"):
+            options["statement_cache_size"] = int(environ["DB_STATEMENT_CACHE_SIZE"])
+        options["min_size"] = min(options["min_size"], options["max_size"])
+        return options
 
     async def connect(self):
-        await self.db.connect()
+        if not self.db.is_connected:
+            await self.db.connect()
         await self.start_transaction()
         self.entry = await self.get_entry()
         return self.entry
@@ -48,6 +101,23 @@ class DatabaseManager:
         self.transaction = await self.db.transaction()
         return self.transaction
 
+    async def start_savepoint(self):
+        """
+        Nests a transaction inside the current one, which databases issues as a SAVEPOINT.
+        """
+        self.savepoint = await self.db.transaction()
+        return self.savepoint
+
+    async def release_savepoint(self):
+        if self.savepoint:
+            await self.savepoint.commit()
+            self.savepoint = None
+
+    async def rollback_savepoint(self):
+        if self.savepoint:
+            await self.savepoint.rollback()
+            self.savepoint = None
+
     async def commit(self):
         if self.transaction:
             await self.transaction.commit()
@@ -59,29 +129,39 @@ class DatabaseManager:
             self.transaction = None
 
     async def disconnect(self):
+        self.savepoint = None
         if self.transaction:
             try:
                 await self.transaction.rollback()
             finally:
                 self.transaction = None
-        await self.db.disconnect()
+        if not self.shared:
+            await self.db.disconnect()
 
     async def get_entry(self):
         return await self.db.execute("INSERT INTO entry (owner) values (:owner) returning id", {"owner": self.owner_id})
 
-    async def view(self, name):
+    async def versions(self, component):
+        """
+        Supported versions of a component, looked up once per pool (see QueryDumper.clear_versions).
+        """
+        cache = getattr(self.db, "versions", None)
+        if cache is not None and component in cache:
+            return cache[component]
         rows = await self.db.fetch_all(
             "SELECT version FROM versions WHERE component = :name AND supported=TRUE",
-            {"name": f"views:{name}"}
+            {"name": component}
         )
-        return [row["version"] for row in rows]
+        versions = [row["version"] for row in rows]
+        if cache is not None:
+            cache[component] = versions
+        return versions
+
+    async def view(self, name):
+        return await self.versions(f"views:{name}")
     
     async def procedure(self, name):
-        rows = await self.db.fetch_all(
-            "SELECT version FROM versions WHERE component = :name AND supported=TRUE",
-            {"name": f"procs:{name}"}
-        )
-        return [row["version"] for row in rows]
+        return await self.versions(f"procs:{name}")
     
     async def best_view(self, name):
         versions = await self.view(name)
@@ -1,6 +1,32 @@
-from typing import Iterable
+import json
+import time
+from typing import Dict, Iterable, List, Tuple
 
 from domain.models import Application, Cloud, ControllerInfo, Machine, Model, Unit
+from domain.serialization import model_to_dict
+from util.metrics import metrics
+
+# Rows per bulk statement, bounding the size of its JSON parameter.
+BULK_CHUNK_SIZE = 1000
+
+
+def _chunks(rows: List, size: int = BULK_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _recordset(table: str, columns: List[str]) -> str:
+    """
+    A SELECT of `columns` from the :rows parameter, a JSON array of objects, typed by `table`'s own row type. The
+    statement text is the same whatever the number of rows, so asyncpg prepares it once per connection, and the
+    server converts each value exactly as for a single-row insert.
+    """
+    listed = ", ".join(columns)
+    return f"SELECT {listed} FROM json_populate_recordset(CAST(NULL AS {table}), CAST(:rows AS json))"
+
+
+def _rows_parameter(rows: List[Dict]) -> Dict[str, str]:
+    return {"rows": json.dumps(rows, separators=(",", ":"))}
 
 
 async def setup_juju_temp_tables_v1(db):
@@ -83,6 +109,164 @@ async def insert_unit(db, entry_id: int, unit: Unit, application_id: int, machin
     )
 
 
+async def insert_machines(db, entry_id: int, model_uuid: str, machines: Iterable[Machine]) -> Dict[int, int]:
+    """
+    Inserts all machines of a model in as few statements as possible. Returns a mapping of machine ordinal to row id.
+    """
+    rows = {}
+    for machine in machines:
+        rows.setdefault(machine.ordinal, {
+            "model": model_uuid,
+            "ordinal": machine.ordinal,
+            "ip": machine.ip,
+            "instance_id": machine.instance_id,
+            "row_source": entry_id,
+        })
+
+    ids = {}
+    for chunk in _chunks(list(rows.values())):
+        result = await db.fetch_all(
+            "INSERT INTO temp_machine"
+            "    (model, ordinal, ip, instance_id, row_source)"
+            f"    {_recordset('temp_machine', ['model', 'ordinal', 'ip', 'instance_id', 'row_source'])}"
+            "    ON CONFLICT (model, ordinal) DO UPDATE SET model = EXCLUDED.model RETURNING id, ordinal",
+            _rows_parameter(chunk),
+        )
+        ids.update({row["ordinal"]: row["id"] for row in result})
+    return ids
+
+
+async def insert_applications(db, entry_id: int, model_uuid: str, applications: Iterable[Application]) -> Dict[str, int]:
+    """
+    Inserts all applications of a model in as few statements as possible. Returns a mapping of application name to row id.
+    """
+    rows = [
+        {
+            "model": model_uuid,
+            "name": application.name,
+            "charm": application.charm,
+            "subordinate": application.subordinate,
+            "row_source": entry_id,
+        }
+        for application in applications
+    ]
+
+    ids = {}
+    for chunk in _chunks(rows):
+        result = await db.fetch_all(
+            "INSERT INTO temp_application"
+            "   (model, name, charm, subordinate, row_source)"
+            f"   {_recordset('temp_application', ['model', 'name', 'charm', 'subordinate', 'row_source'])}"
+            "   RETURNING id, name",
+            _rows_parameter(chunk),
+        )
+        ids.update({row["name"]: row["id"] for row in result})
+    return ids
+
+
+async def insert_units(db, entry_id: int, units: Iterable[Tuple[Unit, int, int]]):
+    """
+    Inserts (unit, application_id, machine_id) triples in as few statements as possible.
+    """
+    rows = [
+        {
+            "ordinal": unit.ordinal,
+            "name": unit.name,
+            "application": application_id,
+            "machine": machine_id,
+            "row_source": entry_id,
+        }
+        for unit, application_id, machine_id in units
+    ]
+
+    for chunk in _chunks(rows):
+        await db.execute(
+            "INSERT INTO temp_unit"
+            "   (ordinal, name, application, machine, row_source)"
+            f"   {_recordset('temp_unit', ['ordinal', 'name', 'application', 'machine', 'row_source'])}",
+            _rows_parameter(chunk),
+        )
+
+
+async def copy_records(db, table: str, columns: List[str], records: List[Tuple]):
+    """
+    Streams records into a table with the COPY protocol. Needs the asyncpg backend, whose raw connection
+    exposes copy_records_to_table; the copy runs on the current task's connection and so joins its transaction.
+    """
+    if not records:
+        return
+    async with db.connection() as connection:
+        raw = connection.raw_connection
+        if not hasattr(raw, "copy_records_to_table"):
+            raise ValueError("COPY writes require the asyncpg database backend (postgresql://... rather than postgresql+aiopg://...).")
+        started = time.perf_counter()
+        await raw.copy_records_to_table(table, records=records, columns=columns)
+        metrics.inc("db_statements_total", statement=f"COPY {table}")
+        metrics.observe("db_statement_seconds", time.perf_counter() - started, statement=f"COPY {table}")
+
+
+async def setup_unit_stage(db):
+    """
+    A session-local staging table for units keyed by natural keys, with column types borrowed from the temp tables.
+    """
+    await db.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS temp_unit_stage AS"
+        "   SELECT m.model, u.ordinal, u.name, a.name AS application_name, m.ordinal AS machine_ordinal"
+        "   FROM temp_unit u, temp_application a, temp_machine m WITH NO DATA"
+    )
+
+
+async def resolve_staged_units(db, entry_id: int):
+    """
+    Moves staged units into temp_unit, resolving application and machine ids server-side by (model, name) and (model, ordinal).
+    """
+    await db.execute(
+        "INSERT INTO temp_unit"
+        "   (ordinal, name, application, machine, row_source)"
+        "   SELECT s.ordinal, s.name, a.id, m.id, :entry_id FROM temp_unit_stage s"
+        "   JOIN temp_application a ON a.model = s.model AND a.name = s.application_name"
+        "   JOIN temp_machine m ON m.model = s.model AND m.ordinal = s.machine_ordinal",
+        {"entry_id": entry_id},
+    )
+    await db.execute("TRUNCATE temp_unit_stage")
+
+
+async def ingest_juju_model(db, entry_id: int, model: Model, version: int):
+    """
+    Hands a whole model to the versioned ingest_juju_model_v<version>(entry, document jsonb) procedure in one statement.
+    The procedure fills temp_model, temp_machine, temp_application and temp_unit exactly like the row inserts would.
+    """
+    await db.execute(
+        f"CALL ingest_juju_model_v{int(version)}(:entry_id, CAST(:document AS jsonb))",
+        {"entry_id": entry_id, "document": json.dumps(model_to_dict(model), separators=(",", ":"))},
+    )
+
+
+async def try_advisory_lock(db, key: int, shared: bool = False) -> bool:
+    """
+    Takes a session-level advisory lock, exclusive or shared, without waiting. It is held until released or the session ends.
+    """
+    function = "pg_try_advisory_lock_shared" if shared else "pg_try_advisory_lock"
+    row = await db.fetch_one(f"SELECT {function}(:key) AS locked", {"key": key})
+    return bool(row["locked"])
+
+
+async def advisory_lock(db, key: int):
+    """
+    Takes a session-level advisory lock, waiting for it if another session holds it.
+    """
+    await db.execute("SELECT pg_advisory_lock(:key)", {"key": key})
+
+
+async def release_advisory_lock(db, key: int, shared: bool = False):
+    function = "pg_advisory_unlock_shared" if shared else "pg_advisory_unlock"
+    await db.execute(f"SELECT {function}(:key)", {"key": key})
+
+
+async def release_advisory_locks(db):
+    await db.execute("SELECT pg_advisory_unlock_all()")
+
+
 async def insert_juju_data(db, owner_id: int):
     await db.execute("CALL insert_juju_data(:owner)", {"owner": owner_id})
 
@@ -115,3 +299,40 @@ async def populate_unreachable_model(db, model_id: str, entry_id: int):
         "   SELECT u.ordinal, u.name, u.application, u.machine, :entry_id FROM unit u JOIN application a ON u.application=a.id WHERE a.model = :model_id",
         {"entry_id": entry_id, "model_id": model_id},
     )
+
+
+async def populate_unreachable_models(db, model_ids: List[str], entry_id: int):
+    """
+    Set-based populate_unreachable_model: copies several models forward from the live tables with four statements in total.
+    """
+    if not model_ids:
+        return
+    values = {"entry_id": entry_id, "model_ids": list(model_ids)}
+
+    await db.execute(
+        "INSERT INTO temp_model"
+        "   (uuid, name, owner, controller, cloud, row_source)"
+        "   SELECT uuid, name, owner, controller, cloud, :entry_id FROM model WHERE uuid = ANY(:model_ids)",
+        values,
+    )
+
+    await db.execute(
+        "INSERT INTO temp_application"
+        "   (id, model, name, charm, subordinate, row_source)"
+        "   SELECT id, model, name, charm, subordinate, :entry_id FROM application WHERE model = ANY(:model_ids)",
+        values,
+    )
+
+    await db.execute(
+        "INSERT INTO temp_machine"
+        "   (id, model, ordinal, ip, instance_id, row_source)"
+        "   SELECT id, model, ordinal, ip, instance_id, :entry_id FROM machine WHERE model = ANY(:model_ids)",
+        values,
+    )
+
+    await db.execute(
+        "INSERT INTO temp_unit"
+        "   (ordinal, name, application, machine, row_source)"
+        "   SELECT u.ordinal, u.name, u.application, u.machine, :entry_id FROM unit u JOIN application a ON u.application=a.id WHERE a.model = ANY(:model_ids)",
+        values,
+    )
@@ -7,6 +7,7 @@ from domain.models import (
     Model,
     Unit,
 )
+from domain.serialization import model_fingerprint, model_from_dict, model_to_dict
 
 __all__ = [
     "Application",
@@ -16,4 +17,7 @@ __all__ = [
     "Machine",
     "Model",
     "Unit",
+    "model_fingerprint",
+    "model_from_dict",
+    "model_to_dict",
 ]
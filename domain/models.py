@@ -1,7 +1,19 @@
+import sys
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 
 
+def _intern(instance, *names):
+    """
+    Interns string fields that repeat across many instances (charms, clouds, owners, instance ids),
+    so every copy shares one string object. Used from __post_init__ of the frozen classes below.
+    """
+    for name in names:
+        value = getattr(instance, name)
+        if isinstance(value, str):
+            object.__setattr__(instance, name, sys.intern(value))
+
+
 @dataclass(frozen=True)
 class ControllerConfig:
     controller: str
@@ -13,7 +25,7 @@ class ControllerConfig:
     endpoint: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Cloud:
     name: str
 
@@ -25,29 +37,38 @@ class ControllerInfo:
     clouds: List[Cloud] = field(default_factory=list)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Machine:
     ordinal: int
     ip: Optional[str]
     instance_id: str
 
+    def __post_init__(self):
+        _intern(self, "instance_id")
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class Unit:
     ordinal: int
     name: str
     machine_instance_id: str
 
+    def __post_init__(self):
+        _intern(self, "machine_instance_id")
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class Application:
     name: str
     charm: str
     subordinate: bool
     units: List[Unit] = field(default_factory=list)
 
+    def __post_init__(self):
+        _intern(self, "name", "charm")
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class Model:
     uuid: str
     name: str
@@ -56,3 +77,6 @@ class Model:
     cloud: str
     applications: List[Application] = field(default_factory=list)
     machines: Dict[str, Machine] = field(default_factory=dict)
+
+    def __post_init__(self):
+        _intern(self, "owner", "controller_uuid", "cloud")
@@ -0,0 +1,70 @@
+import hashlib
+import json
+from typing import Dict
+
+from domain.models import Application, Machine, Model, Unit
+
+
+def model_to_dict(model: Model) -> Dict:
+    """
+    A plain, JSON-serializable representation of a Model. Machines are listed by ordinal rather than keyed by instance id.
+    """
+    return {
+        "uuid": model.uuid,
+        "name": model.name,
+        "owner": model.owner,
+        "controller": model.controller_uuid,
+        "cloud": model.cloud,
+        "machines": [
+            {"ordinal": machine.ordinal, "ip": machine.ip, "instance_id": machine.instance_id}
+            for machine in sorted(model.machines.values(), key=lambda m: m.ordinal)
+        ],
+        "applications": [
+            {
+                "name": application.name,
+                "charm": application.charm,
+                "subordinate": application.subordinate,
+                "units": [
+                    {"ordinal": unit.ordinal, "name": unit.name, "machine_instance_id": unit.machine_instance_id}
+                    for unit in application.units
+                ],
+            }
+            for application in model.applications
+        ],
+    }
+
+
+def model_from_dict(data: Dict) -> Model:
+    """
+    The inverse of model_to_dict.
+    """
+    machines = [Machine(ordinal=m["ordinal"], ip=m["ip"], instance_id=m["instance_id"]) for m in data["machines"]]
+    return Model(
+        uuid=data["uuid"],
+        name=data["name"],
+        owner=data["owner"],
+        controller_uuid=data["controller"],
+        cloud=data["cloud"],
+        applications=[
+            Application(
+                name=a["name"],
+                charm=a["charm"],
+                subordinate=a["subordinate"],
+                units=[Unit(ordinal=u["ordinal"], name=u["name"], machine_instance_id=u["machine_instance_id"]) for u in a["units"]],
+            )
+            for a in data["applications"]
+        ],
+        machines={machine.instance_id: machine for machine in machines},
+    )
+
+
+def model_fingerprint(model: Model) -> str:
+    """
+    A stable digest of everything we store for a model, independent of the order Juju reported applications and units in.
+    """
+    data = model_to_dict(model)
+    data["applications"] = sorted(data["applications"], key=lambda a: a["name"])
+    for application in data["applications"]:
+        application["units"] = sorted(application["units"], key=lambda u: u["ordinal"])
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha256(encoded).hexdigest()
@@ -1,57 +1,147 @@
-import asyncio
-import logging
-
+import argparse
+import os
 import sys
 from os import environ
-from dotenv import load_dotenv
 
-from util.connection_util import connect_to_db
-from configs.logging_config import setup_logging
-from readers.config_reader import ConfigReader
-from services.collector_service import CollectorService
-from writers import DatabaseWriter
+COMMANDS = ("collect", "dry-run", "check-config", "replay")
+
+
+def add_collect_options(parser, claim=True):
+    parser.add_argument(
+        "--shard", default=environ.get("SHARD"), help="collect only shard i of n (1-based) of the controllers, e.g. 2/3"
+    )
+    if claim:
+        parser.add_argument(
+            "--claim",
+            action="store_true",
+            default=bool(environ.get("CLAIM_CONTROLLERS")),
+            help="claim controllers dynamically with other workers through database advisory locks",
+        )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=int(environ.get("PROCESSES", "1")),
+        help="run this many collector processes on this host, 0 for one per CPU core",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        default=environ.get("PROFILE_DIR"),
+        help="write CPU samples (collapsed stacks), a task timeline and the slowest awaits to DIR",
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Collects Juju controllers, models, machines, applications and units.",
+        epilog="Without a command, runs collect.",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    collect = commands.add_parser("collect", help="collect every controller with the configured WRITER (default)")
+    add_collect_options(collect)
+
+    dry_run = commands.add_parser("dry-run", help="collect once and print to the console, without a database")
+    add_collect_options(dry_run, claim=False)
 
-load_dotenv()
-setup_logging()
+    check = commands.add_parser(
+        "check-config", help="validate the controller config and environment without connecting to anything"
+    )
+    check.add_argument("--config", default=environ.get("CONFIG_PATH", "config.yaml"), help="controller config file")
 
-logger = logging.getLogger(__name__)
+    replay = commands.add_parser("replay", help="load snapshot files written with WRITER=snapshot into the database")
+    replay.add_argument("snapshots", nargs="+", metavar="SNAPSHOT")
+    return parser
 
-async def main():
+
+def check_config_command(args) -> int:
+    from readers.config_reader import ConfigError, ConfigReader
+    from writers import WRITERS
+
+    errors = []
     try:
-        config_path = environ.get("CONFIG_PATH", "config.yaml")
-        configs = ConfigReader.load_config(config_path)
+        configs = ConfigReader.load_config(args.config)
     except FileNotFoundError:
-        logger.error("Config file config.yaml not found.")
-        return
+        configs = []
+        errors.append(f"Config file {args.config} not found.")
+    except ConfigError as e:
+        configs = []
+        errors.append(str(e))
+    else:
+        if not configs:
+            errors.append(f"No controllers configured in {args.config}")
 
-    if not configs:
-        logger.error("No controllers configured in config.yaml")
-        return
-    
-    db_url = environ.get("DB_URL")
-    if not db_url:
-        logger.error("Database configuration is missing in environment variables.")
+    writer = environ.get("WRITER", "database")
+    if writer not in WRITERS:
+        errors.append(f"Unknown WRITER {writer}, expected one of {WRITERS}")
+    needs_database = writer == "database" or environ.get("COLLECT_MODE") == "watch" or environ.get("CLAIM_CONTROLLERS")
+    if needs_database and not environ.get("DB_URL"):
+        errors.append("DB_URL is required with this WRITER, COLLECT_MODE or CLAIM_CONTROLLERS.")
+
+    for config in configs:
+        print(f"{config.controller}  {config.uuid}  {config.endpoint}  owner {config.owner_id}")
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        return 1
+    print(f"{len(configs)} controller(s) OK, writer {writer}")
+    return 0
+
+
+def collect_command(args, dry_run=False) -> int:
+    if dry_run:
+        environ["WRITER"] = "console"
+        environ["DAEMON_INTERVAL"] = "0"
+        environ.pop("COLLECT_MODE", None)
+        # Print every model, and leave the fingerprints of the database runs alone.
+        environ.pop("FINGERPRINT_STATE_DIR", None)
+    import collect
+    from services.sharding import parse_shard
+
+    try:
+        shard = parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    return collect.run(shard, getattr(args, "claim", False), args.processes, args.profile)
+
+
+def replay_command(args) -> int:
+    import asyncio
+    from replay import replay
+
+    return 0 if asyncio.run(replay(args.snapshots)) else 1
+
+
+def load_environment():
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        if os.path.exists(".env"):
+            print("python-dotenv is not installed, ignoring .env", file=sys.stderr)
         return
+    load_dotenv()
+
 
-    service = CollectorService()
-    for controller_config in configs:
-        try:
-            dbm, entry_id = await connect_to_db(db_url, controller_config.owner_id)
-            await service.run(controller_config, DatabaseWriter(dbm, entry_id))
-        except Exception as e:
-            logger.exception(
-                "Controller run failed for %s %s", controller_config.controller, controller_config.endpoint
-            )
-            logger.exception(e)
-        finally:
-            if dbm:
-                await dbm.disconnect()
+def main(argv=None) -> int:
+    """
+    Dependencies are imported by the command that needs them, so check-config loads neither juju nor the database
+    driver, and dry-run does not load the database driver. Without python-dotenv, .env is not loaded.
+    """
+    from configs.logging_config import setup_logging
+
+    load_environment()
+    setup_logging()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] not in COMMANDS + ("-h", "--help"):
+        argv = ["collect", *argv]
+    args = build_parser().parse_args(argv)
+
+    if args.command == "check-config":
+        return check_config_command(args)
+    if args.command == "replay":
+        return replay_command(args)
+    return collect_command(args, dry_run=args.command == "dry-run")
 
 
 if __name__ == "__main__":
-    try:
-        timeout = int(environ.get("APP_TIMEOUT", "600"))
-        asyncio.run(asyncio.wait_for(main(), timeout=timeout))
-    except asyncio.TimeoutError:
-        print(f"Application closed due to timeout {timeout}s.")
-        sys.exit(1)
+    sys.exit(main())
@@ -1,20 +1,76 @@
+import uuid
 from typing import List
 import yaml
 
 from domain.models import ControllerConfig
 
+REQUIRED_FIELDS = ("controller", "endpoint", "uuid", "username", "password", "owner_id", "cacert")
+
+
+class ConfigError(ValueError):
+    """
+    An invalid controller config file; `errors` lists every problem found, one per line of the message.
+    """
+    def __init__(self, path: str, errors: List[str]):
+        super().__init__(f"Invalid controller config {path}:\n" + "\n".join(f"  {error}" for error in errors))
+        self.path = path
+        self.errors = errors
+
+
 class ConfigReader:
     @staticmethod
     def load_config(path: str) -> List[ControllerConfig]:
+        """
+        Reads and validates the controllers in `path`. Every entry needs all of REQUIRED_FIELDS, a valid `uuid`
+        that no other entry uses and a positive integer `owner_id`; otherwise a ConfigError lists all the problems.
+        """
         with open(path, 'r') as file:
-            data = yaml.safe_load(file) or {}
-
-        return [ControllerConfig(
-            controller=item.get('controller', ''),
-            username=item.get('username', ''),
-            password=item.get('password', ''),
-            cacert=item.get('cacert', ''),
-            owner_id=item.get('owner_id', 0),
-            uuid=item.get('uuid', ''),
-            endpoint=item.get('endpoint', ''))  for item in data.get('controllers', [])]
-        
+            try:
+                data = yaml.safe_load(file) or {}
+            except yaml.YAMLError as e:
+                raise ConfigError(path, [str(e)])
+
+        items = data.get('controllers') if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise ConfigError(path, ["expected a `controllers` list"])
+
+        errors = []
+        configs = []
+        seen = {}
+        for position, item in enumerate(items, 1):
+            if not isinstance(item, dict):
+                errors.append(f"controllers[{position}]: expected a mapping")
+                continue
+            name = f"controllers[{position}] ({item['controller']})" if item.get('controller') else f"controllers[{position}]"
+            problems = [f"missing `{field}`" for field in REQUIRED_FIELDS if item.get(field) in (None, '')]
+
+            controller_uuid = str(item.get('uuid') or '')
+            if controller_uuid:
+                try:
+                    normalized = uuid.UUID(controller_uuid)
+                except ValueError:
+                    problems.append(f"invalid `uuid` {controller_uuid!r}")
+                else:
+                    if normalized in seen:
+                        problems.append(f"`uuid` {controller_uuid} already used by controllers[{seen[normalized]}]")
+                    seen.setdefault(normalized, position)
+
+            owner_id = item.get('owner_id')
+            if owner_id not in (None, '') and (isinstance(owner_id, bool) or not isinstance(owner_id, int) or owner_id < 1):
+                problems.append(f"invalid `owner_id` {owner_id!r}, expected a positive integer")
+
+            if problems:
+                errors.extend(f"{name}: {problem}" for problem in problems)
+                continue
+            configs.append(ControllerConfig(
+                controller=str(item['controller']),
+                username=str(item['username']),
+                password=str(item['password']),
+                cacert=item['cacert'],
+                owner_id=owner_id,
+                uuid=controller_uuid,
+                endpoint=str(item['endpoint'])))
+
+        if errors:
+            raise ConfigError(path, errors)
+        return configs
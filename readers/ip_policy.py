@@ -0,0 +1,86 @@
+import ipaddress
+from os import environ
+from typing import Iterable, List, Optional, Sequence, Union
+
+Matcher = Union[ipaddress.IPv4Network, ipaddress.IPv6Network, str]
+
+
+def _split(value: Optional[str], default: str) -> List[str]:
+    return [item.strip() for item in (value or default).split(",") if item.strip()]
+
+
+def _matcher(value: str) -> Matcher:
+    """
+    A CIDR network when the value parses as one (192.168.0.0/16), otherwise a plain string prefix (192.168).
+    """
+    if "/" in value:
+        try:
+            return ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            pass
+    return value
+
+
+class IpPolicy:
+    """
+    Picks a machine's address from the basket Juju reports. Built once from the environment and applied in a single
+    pass over each machine's addresses:
+
+        1. Only addresses whose scope and type are permitted are considered.
+        2. An address matching a preferred range wins; earlier ranges take priority, then address order.
+        3. Otherwise the first address outside every banned range is chosen.
+        4. Otherwise the public address is used (necessary for some manually provisioned machines), which may be None.
+
+    Ranges are comma separated and may be CIDR networks or plain string prefixes.
+    """
+    def __init__(
+        self,
+        scopes: Iterable[str] = ("local-cloud",),
+        types: Iterable[str] = ("ipv4",),
+        preferred: Sequence[str] = ("192.168",),
+        banned: Sequence[str] = ("172.17",),
+    ):
+        self.scopes = frozenset(scopes)
+        self.types = frozenset(types)
+        self.preferred = [_matcher(value) for value in preferred]
+        self.banned = [_matcher(value) for value in banned]
+        self._needs_ip = any(not isinstance(m, str) for m in self.preferred + self.banned)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            scopes=_split(environ.get("PERMITTED_IP_SCOPES"), "local-cloud"),
+            types=_split(environ.get("PERMITTED_IP_TYPES"), "ipv4"),
+            preferred=_split(environ.get("PREFERRED_IP_PREFIX"), "192.168"),
+            banned=_split(environ.get("BANNED_IP_PREFIX"), "172.17"),
+        )
+
+    @staticmethod
+    def _matches(matcher: Matcher, value: str, ip) -> bool:
+        if isinstance(matcher, str):
+            return value.startswith(matcher)
+        return ip is not None and ip.version == matcher.version and ip in matcher
+
+    def select(self, addresses, public_address: Optional[str] = None) -> Optional[str]:
+        best = None
+        best_rank = len(self.preferred)
+        permissible = None
+        for address in addresses:
+            if address["scope"] not in self.scopes or address["type"] not in self.types:
+                continue
+            value = address["value"]
+            ip = None
+            if self._needs_ip:
+                try:
+                    ip = ipaddress.ip_address(value)
+                except ValueError:
+                    pass
+            for rank in range(best_rank):
+                if self._matches(self.preferred[rank], value, ip):
+                    best, best_rank = value, rank
+                    break
+            if best is not None and best_rank == 0:
+                break
+            if permissible is None and not any(self._matches(m, value, ip) for m in self.banned):
+                permissible = value
+        return best or permissible or public_address
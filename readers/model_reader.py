@@ -1,3 +1,5 @@
+import time
+from itertools import islice
 from os import environ
 from logging import getLogger
 from typing import Dict
@@ -7,12 +9,28 @@ from juju.errors import JujuError
 
 from domain.models import Application as AppModel
 from domain.models import Machine, Model, Unit
+from readers.ip_policy import IpPolicy
+from util.connection_util import close_model
+from util.metrics import metrics
 
 logger = getLogger(__name__)
 
+
+def permitted_provider_types():
+    """
+    The provider types we collect, from PERMITTED_PROVIDER_TYPES (comma separated, default: lxd,manual).
+    """
+    value = environ.get("PERMITTED_PROVIDER_TYPES") or "lxd,manual"
+    return frozenset(item.strip() for item in value.split(",") if item.strip())
+
+
 class ModelReader:
-    def __init__(self, controller: Controller, controller_uuid: str, model_uuid):
+    def __init__(self, controller: Controller, controller_uuid: str, model_uuid, provider_types=None, ip_policy=None, models=None):
         self.controller = controller
+        # A ModelConnections to take the model connection from and return it to, or None to disconnect once read.
+        self.models = models
+        self.provider_types = provider_types if provider_types is not None else permitted_provider_types()
+        self.ip_policy = ip_policy or IpPolicy.from_env()
         self.uuid = model_uuid
         self.name = ""
         self.owner = ""
@@ -20,6 +38,8 @@ class ModelReader:
         self.controller_uuid = controller_uuid
         self.applications = []
         self.machines: Dict[str, Machine] = {}
+        # Duration of the controller call that fetched the model, fed back to the adaptive concurrency limiter.
+        self.call_seconds = None
 
     def add_application(self, application: Application):
         units = [
@@ -55,24 +75,12 @@ class ModelReader:
 
     def machine_ip(self, machine, public_address):
         """
-        Empirically speaking juju can report a lot of faulty IP addresses. This logic attempts to pick the right one based on a number of criteria.
-
-        * Juju has access to a basket of IP addresses for any one machine. These are classified by scope and type.
-        * Some of these are ipv6 addresses, som ipv4. Some are local to the cloud, some are public, and some are locla to the machine.
-        * The logic here works as follows:
-            1. If an IP address belongs to a "preferred prefix" (default: 192.168), it is preferred and "wins".
-            2. If no IP address belongs to a preferred prefix, the first IP address that is not in a banned prefix (default: 172.17) is chosen.
-            3. If no IP address is found in the above steps, the public address is chosen (necessary for some manually providioned machines).
-            4. If no public address is found, None is returned.
+        Empirically speaking juju can report a lot of faulty IP addresses. The IpPolicy picks the right one
+        based on scope, type and preferred/banned ranges, falling back to the public address.
         """
         try:
-            permitted_scopes = environ.get("PERMITTED_IP_SCOPES") or ["local-cloud"]
-            permitted_types = environ.get("PERMITTED_IP_TYPES") or ["ipv4"]
-            addresses = [address["value"] for address in machine.addresses if address["scope"] in permitted_scopes and address["type"] in permitted_types]
-            preferred = [address for address in addresses if address.startswith(environ.get("PREFERRED_IP_PREFIX") or "192.168")]
-            permissible = [address for address in addresses if not address.startswith(environ.get("BANNED_IP_PREFIX") or "172.17")]
-            return preferred[0] if preferred else permissible[0] if permissible else public_address
-        except (IndexError, AttributeError):
+            return self.ip_policy.select(machine.addresses, public_address)
+        except (KeyError, TypeError, AttributeError):
             logger.warning(
                 "Failed to get IP address for machine %s:%s",
                 self.uuid,
@@ -80,30 +88,81 @@ class ModelReader:
             )
             return None
 
-    async def collect(self):
-        try:
-            model = await self.controller.get_model(self.uuid)
-        except JujuError:
-            logger.error(f"Failed to do get_model on {self.uuid}")
-            raise
-
-        if model.info.provider_type not in ["lxd", "manual"]:
-            logger.info(f"Skipping model {self.uuid} ({model.info.name}) because it is not an lxd or manual model.")
-            raise ValueError(f"Model {self.uuid} is not an lxd or manual model.")
-        
+    async def _open(self):
+        """
+        Connects to the model, or takes its pooled connection. The caller must _release() it.
+        """
+        model = await self.models.take(self.uuid) if self.models is not None else None
+        if model is None:
+            try:
+                started = time.perf_counter()
+                with metrics.phase("get_model"):
+                    model = await self.controller.get_model(self.uuid)
+                self.call_seconds = time.perf_counter() - started
+            except JujuError:
+                logger.error(f"Failed to do get_model on {self.uuid}")
+                raise
+            metrics.inc("model_connections_total", outcome="opened")
+
+        if model.info.provider_type not in self.provider_types:
+            logger.info(f"Skipping model {self.uuid} ({model.info.name}) because provider {model.info.provider_type} is not permitted.")
+            await self._release(model, reuse=False)
+            raise ValueError(f"Model {self.uuid} has non-permitted provider {model.info.provider_type}.")
+
         self.name = model.info.name
         self.owner = model.info.owner_tag[5:]
         self.cloud = model.info.cloud_tag[6:]
         logger.info(f"Collecting data for model {self.uuid} ({self.name})")
-        for application in model.applications.values():
-            self.add_application(application)
-            logger.info(f"Collected data for application {self.uuid}:{application.name}")
+        return model
+
+    async def _release(self, model, reuse=True):
+        """
+        Returns the connection to the pool once the domain Model has been extracted, or disconnects it: always
+        without a pool, and after a failed or cancelled read, since its state may be incomplete.
+        """
+        if reuse and self.models is not None:
+            await self.models.put(self.uuid, model)
+        else:
+            await close_model(model, self.uuid)
+
+    def _model(self, applications=None, machines=None):
         return Model(
             uuid=self.uuid,
             name=self.name,
             owner=self.owner,
             controller_uuid=self.controller_uuid,
             cloud=self.cloud,
-            applications=self.applications,
-            machines=self.machines,
+            applications=self.applications if applications is None else applications,
+            machines=self.machines if machines is None else machines,
         )
+
+    async def collect(self):
+        model = await self._open()
+        read = False
+        try:
+            for application in model.applications.values():
+                self.add_application(application)
+                logger.info(f"Collected data for application {self.uuid}:{application.name}")
+            read = True
+        finally:
+            await self._release(model, reuse=read)
+        return self._model()
+
+    async def stream(self):
+        """
+        Yields the model header (a Model without applications or machines) and then, per application,
+        the Application together with the machines first seen for it. Applications are not kept once yielded.
+        Iterate it under contextlib.aclosing, so that the model connection is released as soon as the consumer stops.
+        """
+        model = await self._open()
+        read = False
+        try:
+            yield self._model(applications=[], machines={})
+            # A copy, since the AllWatcher may add applications while the consumer holds a yielded one.
+            for application in list(model.applications.values()):
+                known = len(self.machines)
+                self.add_application(application)
+                yield self.applications.pop(), list(islice(self.machines.values(), known, None))
+            read = True
+        finally:
+            await self._release(model, reuse=read)
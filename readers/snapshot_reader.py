@@ -0,0 +1,38 @@
+import gzip
+import json
+from typing import Dict, Iterator
+
+from domain.models import Cloud, ControllerInfo
+
+
+class SnapshotReader:
+    """
+    Reads a snapshot written by SnapshotWriter. The first record describes the controller; records() yields the rest.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with self._open() as file:
+            self.header: Dict = json.loads(file.readline() or "{}")
+        if self.header.get("type") != "controller":
+            raise ValueError(f"{path} is not a collector snapshot.")
+
+    def _open(self):
+        return gzip.open(self.path, "rt") if self.path.endswith(".gz") else open(self.path, "r")
+
+    @property
+    def owner_id(self) -> int:
+        return self.header["owner_id"]
+
+    def controller_info(self) -> ControllerInfo:
+        return ControllerInfo(
+            name=self.header["name"],
+            uuid=self.header["uuid"],
+            clouds=[Cloud(name=name) for name in self.header["clouds"]],
+        )
+
+    def records(self) -> Iterator[Dict]:
+        with self._open() as file:
+            file.readline()
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
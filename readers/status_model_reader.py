@@ -0,0 +1,187 @@
+import asyncio
+import ipaddress
+import time
+from collections import namedtuple
+from logging import getLogger
+from typing import Dict, List
+from juju import client
+from juju.client.connection import Connection
+from juju.controller import Controller
+from juju.errors import JujuError
+from juju.url import URL
+
+from domain.models import Application as AppModel
+from domain.models import Unit
+from readers.model_reader import ModelReader
+from util.metrics import metrics
+
+logger = getLogger(__name__)
+
+StatusMachine = namedtuple("StatusMachine", ["id", "instance_id", "addresses"])
+
+
+def address_scope(value: str):
+    """
+    Classifies an address the way Juju does when it reports scoped addresses, since FullStatus only returns bare IPs.
+    """
+    ip = ipaddress.ip_address(value)
+    if ip.is_loopback:
+        return "local-machine"
+    if ip.is_link_local:
+        return "link-local"
+    if ip.is_private:
+        return "local-cloud"
+    return "public"
+
+
+def scoped_addresses(values: List[str]):
+    addresses = []
+    for value in values or []:
+        try:
+            addresses.append({
+                "value": value,
+                "scope": address_scope(value),
+                "type": f"ipv{ipaddress.ip_address(value).version}",
+            })
+        except ValueError:
+            continue
+    return addresses
+
+
+class StatusModelReader(ModelReader):
+    """
+    Builds the same domain Model as ModelReader from a single FullStatus call on a bare model connection,
+    without starting the AllWatcher that controller.get_model() would. Model metadata is fetched separately
+    through the controller-level ModelInfo call, which accepts many models at once (see model_infos).
+    """
+    def __init__(self, controller: Controller, controller_uuid: str, model_uuid, info=None, provider_types=None, ip_policy=None):
+        super().__init__(controller, controller_uuid, model_uuid, provider_types, ip_policy)
+        self.info = info
+
+    @staticmethod
+    async def model_infos(controller: Controller, model_uuids: List[str], batch_size: int = 50) -> Dict[str, object]:
+        """
+        Fetches ModelInfo for many models through the controller connection, batch_size models per call.
+        Models the controller returned an error for are left out of the result.
+        """
+        facade = client.ModelManagerFacade.from_connection(controller.connection())
+        infos = {}
+        for start in range(0, len(model_uuids), batch_size):
+            batch = model_uuids[start:start + batch_size]
+            response = await facade.ModelInfo(entities=[client.Entity(tag=f"model-{uuid}") for uuid in batch])
+            for uuid, result in zip(batch, response.results):
+                if result.error:
+                    logger.warning("Failed to get model info for %s: %s", uuid, result.error.message)
+                    continue
+                infos[uuid] = result.result
+        return infos
+
+    async def _get_info(self):
+        if self.info is None:
+            infos = await self.model_infos(self.controller, [self.uuid])
+            if self.uuid not in infos:
+                raise JujuError(f"Failed to get model info for {self.uuid}")
+            self.info = infos[self.uuid]
+        return self.info
+
+    async def _get_status(self):
+        params = self.controller.connection().connect_params()
+        params["uuid"] = self.uuid
+        connection = await Connection.connect(**params)
+        metrics.inc("model_connections_total", outcome="opened")
+        try:
+            return await client.ClientFacade.from_connection(connection).FullStatus(patterns=[])
+        finally:
+            # Shielded so that a read cancelled by its timeout still closes the connection.
+            await asyncio.shield(connection.close())
+            metrics.inc("model_connections_total", outcome="closed")
+
+    def add_status_machines(self, machines):
+        """
+        Flattens the machine tree (containers are nested under their hosts) into StatusMachine records keyed by machine id.
+        """
+        flattened = {}
+        for machine_id, machine in (machines or {}).items():
+            flattened[machine_id] = StatusMachine(
+                id=machine_id,
+                instance_id=machine.instance_id,
+                addresses=scoped_addresses(machine.ip_addresses),
+            )
+            flattened.update(self.add_status_machines(machine.containers))
+        return flattened
+
+    def add_status_application(self, name, application, units, machines):
+        domain_units = []
+        for unit_name, unit, machine_id in units:
+            machine = machines.get(machine_id)
+            if machine is None:
+                logger.warning("Unit %s in model %s has no machine", unit_name, self.uuid)
+                continue
+            domain_units.append(Unit(
+                ordinal=int(unit_name.split("/")[1]),
+                name=unit_name,
+                machine_instance_id=self.add_machine(machine, unit.public_address),
+            ))
+        self.applications.append(
+            AppModel(
+                name=name,
+                charm=URL.parse(application.charm).name,
+                subordinate=bool(application.subordinate_to),
+                units=domain_units,
+            )
+        )
+
+    async def collect(self):
+        try:
+            info = await self._get_info()
+        except JujuError:
+            logger.error(f"Failed to get model info on {self.uuid}")
+            raise
+
+        if info.provider_type not in self.provider_types:
+            logger.info(f"Skipping model {self.uuid} ({info.name}) because provider {info.provider_type} is not permitted.")
+            raise ValueError(f"Model {self.uuid} has non-permitted provider {info.provider_type}.")
+
+        try:
+            started = time.perf_counter()
+            with metrics.phase("full_status"):
+                status = await self._get_status()
+            self.call_seconds = time.perf_counter() - started
+        except JujuError:
+            logger.error(f"Failed to get status on {self.uuid}")
+            raise
+
+        self.name = info.name
+        self.owner = info.owner_tag[5:]
+        self.cloud = info.cloud_tag[6:]
+        logger.info(f"Collecting status for model {self.uuid} ({self.name})")
+        machines = self.add_status_machines(status.machines)
+
+        # Subordinate units are only reported under their principal unit, on the principal's machine.
+        units = {name: [] for name in (status.applications or {})}
+        for application in (status.applications or {}).values():
+            for unit_name, unit in (application.units or {}).items():
+                units[unit_name.split("/")[0]].append((unit_name, unit, unit.machine))
+                for sub_name, sub in (unit.subordinates or {}).items():
+                    units.setdefault(sub_name.split("/")[0], []).append((sub_name, sub, unit.machine))
+
+        for name, application in (status.applications or {}).items():
+            self.add_status_application(name, application, units[name], machines)
+            logger.info(f"Collected data for application {self.uuid}:{name}")
+        return self._model()
+
+    async def stream(self):
+        """
+        FullStatus arrives in one response, so the model is read whole and then handed out in the same
+        (header, then application with its newly seen machines) shape as ModelReader.stream.
+        """
+        model = await self.collect()
+        yield self._model(applications=[], machines={})
+        seen = set()
+        for application in model.applications:
+            machines = []
+            for unit in application.units:
+                if unit.machine_instance_id not in seen:
+                    seen.add(unit.machine_instance_id)
+                    machines.append(model.machines[unit.machine_instance_id])
+            yield application, machines
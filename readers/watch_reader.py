@@ -0,0 +1,125 @@
+from logging import getLogger
+from typing import Dict, Optional
+from juju.url import URL
+
+from domain.models import Application as AppModel
+from domain.models import Model, Unit
+from readers.model_reader import ModelReader
+from readers.status_model_reader import StatusMachine
+
+logger = getLogger(__name__)
+
+
+class ModelState:
+    """
+    The parts of a model we store, kept current by applying AllWatcher deltas (the same entity dictionaries
+    python-libjuju receives) for applications, units and machines. `dirty` is set whenever a delta changed anything.
+    """
+    def __init__(self, uuid: str, name: str, owner: str, cloud: str, controller_uuid: str):
+        self.uuid = uuid
+        self.name = name
+        self.owner = owner
+        self.cloud = cloud
+        self.controller_uuid = controller_uuid
+        self.applications: Dict[str, dict] = {}
+        self.units: Dict[str, dict] = {}
+        self.machines: Dict[str, dict] = {}
+        self.dirty = True
+
+    def apply(self, entity: str, action: str, data: dict):
+        if entity == "application":
+            key = data["name"]
+            record = {"charm": URL.parse(data["charm-url"]).name, "subordinate": bool(data.get("subordinate"))}
+            table = self.applications
+        elif entity == "unit":
+            key = data["name"]
+            record = {
+                "application": data["application"],
+                "machine": data.get("machine-id") or None,
+                "public_address": data.get("public-address") or None,
+            }
+            table = self.units
+        elif entity == "machine":
+            key = data["id"]
+            record = {"instance_id": data.get("instance-id"), "addresses": list(data.get("addresses") or [])}
+            table = self.machines
+        else:
+            return
+
+        if action == "remove":
+            changed = table.pop(key, None) is not None
+        else:
+            changed = table.get(key) != record
+            table[key] = record
+        self.dirty = self.dirty or changed
+
+    def to_model(self, reader: ModelReader) -> Model:
+        """
+        Builds the domain Model, picking machine IPs with the reader's policy exactly as a full read would.
+        """
+        units: Dict[str, list] = {name: [] for name in self.applications}
+        for unit_name, unit in sorted(self.units.items(), key=lambda item: int(item[0].split("/")[1])):
+            machine: Optional[dict] = self.machines.get(unit["machine"]) if unit["machine"] else None
+            if machine is None or not machine["instance_id"] or unit["application"] not in units:
+                continue
+            units[unit["application"]].append(Unit(
+                ordinal=int(unit_name.split("/")[1]),
+                name=unit_name,
+                machine_instance_id=reader.add_machine(
+                    StatusMachine(id=unit["machine"], instance_id=machine["instance_id"], addresses=machine["addresses"]),
+                    unit["public_address"],
+                ),
+            ))
+
+        for name, application in self.applications.items():
+            reader.applications.append(
+                AppModel(name=name, charm=application["charm"], subordinate=application["subordinate"], units=units[name])
+            )
+        return Model(
+            uuid=self.uuid,
+            name=self.name,
+            owner=self.owner,
+            controller_uuid=self.controller_uuid,
+            cloud=self.cloud,
+            applications=reader.applications,
+            machines=reader.machines,
+        )
+
+
+class ModelWatcher:
+    """
+    Holds a model connection (and therefore its AllWatcher) open and feeds every application, unit and machine
+    delta into a ModelState. The initial state is seeded from the entities libjuju already holds after connecting.
+    """
+    ENTITIES = ("application", "unit", "machine")
+
+    def __init__(self, model, controller_uuid: str):
+        self.model = model
+        info = model.info
+        self.state = ModelState(
+            uuid=info.uuid,
+            name=info.name,
+            owner=info.owner_tag[5:],
+            cloud=info.cloud_tag[6:],
+            controller_uuid=controller_uuid,
+        )
+        for application in model.applications.values():
+            self.state.apply("application", "add", application.safe_data)
+        for machine in model.machines.values():
+            self.state.apply("machine", "add", machine.safe_data)
+        for unit in model.units.values():
+            self.state.apply("unit", "add", unit.safe_data)
+        for entity in self.ENTITIES:
+            model.add_observer(self.on_change, entity_type=entity)
+
+    async def on_change(self, delta, old, new, model):
+        try:
+            self.state.apply(delta.entity, delta.type, delta.data)
+        except (KeyError, ValueError, TypeError):
+            logger.warning("Ignoring malformed %s delta in model %s", delta.entity, self.state.uuid, exc_info=True)
+
+    def is_connected(self) -> bool:
+        return self.model.is_connected()
+
+    async def close(self):
+        await self.model.disconnect()
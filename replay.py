@@ -0,0 +1,52 @@
+import asyncio
+import logging
+
+import sys
+from os import environ
+
+from db.database_manager import DatabaseManager
+from readers.snapshot_reader import SnapshotReader
+from services.replay_service import ReplayService
+from util.connection_util import connect_to_db
+from writers import make_database_writer
+
+logger = logging.getLogger(__name__)
+
+
+async def replay(paths):
+    """
+    Replays snapshot files into the database in order over one pool, each under its own entry for the owner recorded in the snapshot.
+    """
+    db_url = environ.get("DB_URL")
+    if not db_url:
+        logger.error("Database configuration is missing in environment variables.")
+        return False
+
+    service = ReplayService()
+    database = DatabaseManager.create_database(db_url)
+    await database.connect()
+    ok = True
+    try:
+        for path in paths:
+            try:
+                snapshot = SnapshotReader(path)
+                dbm, entry_id = await connect_to_db(db_url, snapshot.owner_id, database)
+                ok = await service.run(snapshot, make_database_writer(dbm, entry_id)) and ok
+            except Exception:
+                ok = False
+                logger.exception("Replay failed for %s", path)
+    finally:
+        await database.disconnect()
+    return ok
+
+
+if __name__ == "__main__":
+    from configs.logging_config import setup_logging
+    from main import load_environment
+
+    load_environment()
+    setup_logging()
+    if len(sys.argv) < 2:
+        print("Usage: python3 replay.py SNAPSHOT [SNAPSHOT ...]")
+        sys.exit(2)
+    sys.exit(0 if asyncio.run(replay(sys.argv[1:])) else 1)
@@ -1,74 +1,465 @@
+import asyncio
 import logging
+import time
+from contextlib import aclosing
+from os import environ
 
+from juju import client
 from juju.errors import JujuError
 
 from domain.models import Cloud, ControllerInfo, ControllerConfig
-from readers.model_reader import ModelReader
+from domain.serialization import model_fingerprint
+from readers.ip_policy import IpPolicy
+from readers.model_reader import ModelReader, permitted_provider_types
+from readers.status_model_reader import StatusModelReader
+from util.concurrency import AdaptiveLimiter
 from util.connection_util import connect_to_juju
+from util.deadline import expired, with_backoff, with_deadline
+from util.fingerprint_store import FingerprintStore
+from util.metrics import current_controller, metrics
+
+
+# Marks the end of a streamed model on its queue.
+_END_OF_MODEL = object()
 
 
 class CollectorService:
-    def __init__(self):
+    READERS = ("full", "status")
+
+    def __init__(self, model_concurrency=None, model_timeout=None, model_reader=None):
         self.logger = logging.getLogger("CollectorService")
+        self.model_concurrency = max(1, int(model_concurrency or environ.get("MODEL_CONCURRENCY", "1")))
+        self.model_timeout = float(model_timeout or environ.get("MODEL_TIMEOUT", "120"))
+        self.model_reader = model_reader or environ.get("MODEL_READER", "full")
+        if self.model_reader not in self.READERS:
+            raise ValueError(f"Unknown model reader {self.model_reader}, expected one of {self.READERS}")
+        self.status_batch_size = max(1, int(environ.get("STATUS_BATCH_SIZE", "50")))
+        self.provider_types = permitted_provider_types()
+        self.ip_policy = IpPolicy.from_env()
+        self.state_dir = environ.get("FINGERPRINT_STATE_DIR")
+        self.pipeline = bool(environ.get("PIPELINE"))
+        self.pipeline_queue_size = max(1, int(environ.get("PIPELINE_QUEUE_SIZE", "8")))
+        self.connect_retries = max(0, int(environ.get("CONNECT_RETRIES", "2")))
+        self.write_retries = max(0, int(environ.get("MODEL_WRITE_RETRIES", "1")))
+        self.limiters = {}
 
-    async def run(self, controller_config: ControllerConfig, writer):
+    async def run(self, controller_config: ControllerConfig, writer, controllers=None):
+        """
+        Collects one controller into the writer. With `controllers` (a ControllerConnections) the controller
+        connection is borrowed and kept open for the next run; it is only discarded if this run fails.
+        Connecting is retried with backoff, and model reads are cut short at the current deadline (see util.deadline).
+        Returns True when the controller was finalized.
+        """
         controller = None
+        finalized = False
+        current_controller.set(controller_config.controller)
         try:
-            controller = await connect_to_juju(
-                controller_config.endpoint,
-                controller_config.username,
-                controller_config.password,
-                controller_config.cacert,
-            )
+            with metrics.phase("connect"):
+                controller = await with_backoff(
+                    lambda: self._connect(controller_config, controllers),
+                    self.connect_retries,
+                    (JujuError, OSError, asyncio.TimeoutError),
+                    what=f"Connecting to controller {controller_config.controller}",
+                )
             self.logger.info(
                 "Connected to controller %s", controller_config.controller
             )
 
-            clouds = await self._get_clouds(controller)
-            controller_info = ControllerInfo(
-                name=controller_config.controller,
-                uuid=controller_config.uuid,
-                clouds=clouds,
-            )
-            await writer.prepare_controller(controller_info)
+            with metrics.phase("prepare"):
+                clouds = await self._get_clouds(controller)
+                controller_info = ControllerInfo(
+                    name=controller_config.controller,
+                    uuid=controller_config.uuid,
+                    clouds=clouds,
+                )
+                await writer.prepare_controller(controller_info)
 
-            models = await controller.model_uuids(all=True)
-            for model_uuid in models.values():
-                await self._process_model(writer, controller, controller_config.uuid, model_uuid)
+            fingerprints = None
+            if self.state_dir and getattr(writer, "supports_fingerprints", False):
+                fingerprints = FingerprintStore(self.state_dir, controller_config.uuid)
+            with metrics.phase("list_models"):
+                model_uuids = await self._list_models(controller)
+            with metrics.phase("models"):
+                await self._process_models(
+                    writer,
+                    controller,
+                    controller_config.uuid,
+                    model_uuids,
+                    fingerprints,
+                    controllers.models if controllers is not None else None,
+                )
 
             try:
-                await writer.finalize_controller()
+                with metrics.phase("finalize"):
+                    await writer.finalize_controller()
             except Exception:
                 self.logger.exception(
                     "Failed to finalize controller %s", controller_config.controller
                 )
+            else:
+                finalized = True
+            self._record_failed_writes(writer, fingerprints)
+            if finalized and fingerprints:
+                fingerprints.save()
+                self.logger.info(
+                    "Controller %s: %d new, %d changed, %d unchanged model(s) skipped",
+                    controller_config.controller,
+                    fingerprints.counts["new"],
+                    fingerprints.counts["changed"],
+                    fingerprints.counts["unchanged"],
+                )
+        except BaseException:
+            if controllers is not None:
+                await controllers.discard(controller_config)
+                controller = None
+            raise
         finally:
             if writer:
                 await writer.close()
-            if controller:
+            if controller and controllers is None:
                 await controller.disconnect()
+        return finalized
+
+    def _record_failed_writes(self, writer, fingerprints=None):
+        """
+        Marks models whose buffered write the writer undid after reporting it done as failed, and drops their new
+        fingerprints: the previous one still describes the live tables if they were carried forward, and none does otherwise.
+        """
+        take_failed_models = getattr(writer, "take_failed_models", None)
+        if take_failed_models is None:
+            return
+        for model_uuid, carried_forward in take_failed_models():
+            metrics.update_model(model_uuid, "failed")
+            if fingerprints:
+                fingerprints.discard(model_uuid)
+                if carried_forward:
+                    fingerprints.carry_forward(model_uuid)
+
+    async def _connect(self, controller_config, controllers=None):
+        if controllers is not None:
+            return await controllers.get(controller_config)
+        return await connect_to_juju(
+            controller_config.endpoint,
+            controller_config.username,
+            controller_config.password,
+            controller_config.cacert,
+        )
+
+    async def _process_models(self, writer, controller, controller_uuid, model_uuids, fingerprints=None, models=None):
+        """
+        Reads models concurrently (bounded by model_concurrency, or per controller by an AdaptiveLimiter) while writing them one at a time
+        in the order the controller listed them, so the writer's transaction sees a deterministic sequence.
+        Model connections are released as soon as each model is read, back to `models` (a ModelConnections) if given.
+        """
+        infos = {}
+        if self.model_reader == "status":
+            infos = await StatusModelReader.model_infos(controller, model_uuids, self.status_batch_size)
+
+        semaphore = self._limiter(controller_uuid)
+        readers = [self._reader(controller, controller_uuid, model_uuid, infos, models) for model_uuid in model_uuids]
+        try:
+            if self.pipeline and getattr(writer, "supports_streaming", False) and not fingerprints:
+                await self._stream_models(writer, semaphore, readers)
+                return
+            collections = [
+                asyncio.create_task(self._collect_model(semaphore, reader), name=f"model {reader.uuid}")
+                for reader in readers
+            ]
+            try:
+                for reader, collection in zip(readers, collections):
+                    await self._process_model(writer, reader.uuid, collection, fingerprints, reader)
+            finally:
+                for collection in collections:
+                    collection.cancel()
+        finally:
+            if isinstance(semaphore, AdaptiveLimiter):
+                self.logger.info("Controller %s: %s", semaphore.name, semaphore.summary())
+
+    def _limiter(self, controller_uuid):
+        """
+        The controller's AdaptiveLimiter, kept across runs so it starts where it left off, or a fixed
+        MODEL_CONCURRENCY semaphore when adaptive concurrency is off.
+        """
+        limiter = self.limiters.get(controller_uuid)
+        if limiter is None:
+            limiter = AdaptiveLimiter.from_env(current_controller.get() or controller_uuid, self.model_concurrency)
+            if limiter is None:
+                return asyncio.Semaphore(self.model_concurrency)
+            self.limiters[controller_uuid] = limiter
+        limiter.reset_counts()
+        return limiter
+
+    def _feedback(self, limiter, reader, error=None):
+        """
+        Reports a model read to an adaptive limiter. Juju errors, connection errors and timeouts count as failures;
+        skipped models count as successes, and reads cut short by cancellation or the run's deadline are ignored.
+        """
+        if not isinstance(limiter, AdaptiveLimiter) or isinstance(error, asyncio.CancelledError):
+            return
+        if isinstance(error, asyncio.TimeoutError) and expired():
+            return
+        limiter.record(reader.call_seconds, not isinstance(error, (JujuError, OSError, asyncio.TimeoutError)), reader.uuid)
+
+    async def _stream_models(self, writer, semaphore, readers):
+        """
+        Pipelined variant of _process_models: each reader streams its model through a bounded queue, and the writer
+        inserts applications as they arrive, so Juju and DB I/O overlap and at most PIPELINE_QUEUE_SIZE parts per
+        in-flight model are held in memory. Models are still written one at a time in listing order. Semaphore slots
+        are granted in listing order, so the model being written always holds one and the pipeline cannot stall.
+        """
+        queues = [asyncio.Queue(maxsize=self.pipeline_queue_size) for _ in readers]
+        productions = [
+            asyncio.create_task(self._produce_model(semaphore, reader, queue), name=f"model {reader.uuid}")
+            for reader, queue in zip(readers, queues)
+        ]
+        try:
+            for reader, queue, production in zip(readers, queues, productions):
+                await self._consume_model(writer, reader.uuid, queue, production)
+        finally:
+            for production in productions:
+                production.cancel()
+
+    async def _produce_model(self, semaphore, reader, queue):
+        """
+        Streams one model onto its queue. MODEL_TIMEOUT bounds the time spent reading from the controller only, not
+        the time spent waiting for the in-order writer to make room on the queue.
+        """
+        async with semaphore:
+            read_seconds = 0.0
+            error = None
+            try:
+                async with aclosing(reader.stream()) as stream:
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            item = await with_deadline(anext(stream), self.model_timeout - read_seconds)
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            read_seconds += time.perf_counter() - started
+                        await queue.put(item)
+            except asyncio.CancelledError as e:
+                # The consumer gave up on this model and is no longer draining the queue.
+                error = e
+                raise
+            except Exception as e:
+                error = e
+                await queue.put(_END_OF_MODEL)
+                raise
+            else:
+                await queue.put(_END_OF_MODEL)
+            finally:
+                metrics.observe("phase_seconds", read_seconds, phase="read_model")
+                self._feedback(semaphore, reader, error)
+
+    async def _consume_model(self, writer, model_uuid, queue, production):
+        """
+        Writes one streamed model inside its own savepoint. If reading or writing fails partway, whatever was
+        written is rolled back and the model is carried forward from the live tables instead. Read errors surface
+        from `production` only, so a writer error (even a ValueError, such as asyncpg's DataError) is never taken
+        for a skipped model.
+        """
+        started = False
+        rows = 0
+        try:
+            try:
+                item = await queue.get()
+                while item is not _END_OF_MODEL:
+                    if not started:
+                        header = item
+                        await writer.start_model()
+                        started = True
+                        await writer.begin_model(header)
+                    else:
+                        application, machines = item
+                        await writer.write_model_part(header, application, machines)
+                        rows += 1 + len(application.units) + len(machines)
+                    item = await queue.get()
+            except Exception:
+                await self._handle_failed_write(writer, model_uuid, started)
+                return
+
+            try:
+                await production
+            except JujuError:
+                self.logger.error("Failed to read model %s", model_uuid)
+                await self._rollback_model(writer, started)
+                await self._handle_unreachable_model(writer, model_uuid)
+                return
+            except asyncio.TimeoutError:
+                await self._rollback_model(writer, started)
+                await self._handle_timed_out_model(writer, model_uuid)
+                return
+            except ValueError:
+                await self._rollback_model(writer, started)
+                self.logger.info("Skipping model %s", model_uuid)
+                metrics.record_model(model_uuid, "skipped")
+                return
+            except Exception:
+                self.logger.exception("Failed to stream model %s, carrying it forward", model_uuid)
+                await self._rollback_model(writer, started)
+                await self._handle_unreachable_model(writer, model_uuid, outcome="failed")
+                return
+
+            if started:
+                try:
+                    await writer.commit_model()
+                except Exception:
+                    await self._handle_failed_write(writer, model_uuid, started)
+                    return
+        finally:
+            if not production.done():
+                production.cancel()
+
+        metrics.inc("rows_written_total", rows)
+        metrics.record_model(model_uuid, "written", rows=rows)
+
+    async def _handle_failed_write(self, writer, model_uuid, started):
+        self.logger.exception("Failed to write model %s, carrying it forward", model_uuid)
+        await self._rollback_model(writer, started)
+        await self._handle_unreachable_model(writer, model_uuid, outcome="failed")
 
-    async def _process_model(self, writer, controller, controller_uuid, model_uuid):
+    async def _rollback_model(self, writer, started=True):
+        if not started:
+            return
         try:
-            model = await ModelReader(controller, controller_uuid, model_uuid).collect()
+            await writer.rollback_model()
+        except Exception:
+            self.logger.exception("Failed to roll back model savepoint")
+
+    async def _write_in_savepoint(self, writer, model):
+        """
+        Writes one model inside its own savepoint, retried up to MODEL_WRITE_RETRIES times. A failed attempt is rolled
+        back on its own, so the controller's transaction stays usable for the models after it.
+        """
+        for attempt in range(self.write_retries + 1):
+            await writer.start_model()
+            try:
+                await writer.write_model(model)
+                await writer.commit_model()
+                return
+            except Exception:
+                await writer.rollback_model()
+                if attempt == self.write_retries:
+                    raise
+                self.logger.warning("Failed to write model %s, retrying", model.uuid, exc_info=True)
+
+    async def _list_models(self, controller):
+        """
+        Lists every model on the controller with a single ListModelSummaries call and returns the UUIDs
+        of those whose provider type is permitted, so ineligible models are never connected to.
+        """
+        facade = client.ModelManagerFacade.from_connection(controller.connection())
+        response = await facade.ListModelSummaries(
+            user_tag=f"user-{controller.get_current_username()}", all_=True
+        )
+        model_uuids = []
+        for summary in response.results:
+            if summary.error:
+                self.logger.warning("Failed to get model summary: %s", summary.error.message)
+                continue
+            if summary.result.provider_type in self.provider_types:
+                model_uuids.append(summary.result.uuid)
+        self.logger.info(
+            "Found %d model(s), %d with a permitted provider type (%s)",
+            len(response.results),
+            len(model_uuids),
+            ", ".join(sorted(self.provider_types)),
+        )
+        return model_uuids
+
+    def _reader(self, controller, controller_uuid, model_uuid, infos, models=None):
+        if self.model_reader == "status":
+            # FullStatus is read over a bare connection opened and closed per call, so there is nothing to pool.
+            return StatusModelReader(
+                controller, controller_uuid, model_uuid, infos.get(model_uuid), self.provider_types, self.ip_policy
+            )
+        return ModelReader(controller, controller_uuid, model_uuid, self.provider_types, self.ip_policy, models)
+
+    async def _collect_model(self, semaphore, reader):
+        async with semaphore:
+            started = time.perf_counter()
+            error = None
+            try:
+                return await with_deadline(reader.collect(), self.model_timeout)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                reader.read_seconds = time.perf_counter() - started
+                metrics.observe("phase_seconds", reader.read_seconds, phase="read_model")
+                self._feedback(semaphore, reader, error)
+
+    async def _process_model(self, writer, model_uuid, collection, fingerprints=None, reader=None):
+        try:
+            model = await collection
         except JujuError:
             self.logger.error("Failed to get model %s", model_uuid)
-            await self._handle_unreachable_model(writer, model_uuid)
+            await self._handle_unreachable_model(writer, model_uuid, fingerprints)
+            return
+        except asyncio.TimeoutError:
+            await self._handle_timed_out_model(writer, model_uuid, fingerprints)
             return
         except ValueError:
             self.logger.info("Skipping model %s", model_uuid)
+            metrics.record_model(model_uuid, "skipped")
+            return
+
+        read_seconds = round(getattr(reader, "read_seconds", 0.0), 3)
+        if fingerprints and fingerprints.check(model_uuid, model_fingerprint(model)):
+            try:
+                await writer.write_unchanged_model(model_uuid)
+            except Exception:
+                fingerprints.discard(model_uuid)
+                metrics.record_model(model_uuid, "failed", read_seconds=read_seconds)
+                self.logger.exception("Failed to carry forward model %s", model_uuid)
+            else:
+                metrics.record_model(model_uuid, "unchanged", read_seconds=read_seconds)
             return
 
+        rows = len(model.machines) + len(model.applications) + sum(len(a.units) for a in model.applications)
+        started = time.perf_counter()
         try:
-            await writer.write_model(model)
+            with metrics.phase("write_model"):
+                await self._write_in_savepoint(writer, model)
         except Exception:
-            self.logger.exception("Failed to write model %s", model_uuid)
+            self.logger.exception("Failed to write model %s, carrying it forward", model_uuid)
+            if fingerprints:
+                fingerprints.discard(model_uuid)
+            await self._handle_unreachable_model(
+                writer, model_uuid, fingerprints, outcome="failed", read_seconds=read_seconds
+            )
+        else:
+            metrics.inc("rows_written_total", rows)
+            metrics.record_model(
+                model_uuid,
+                "written",
+                read_seconds=read_seconds,
+                write_seconds=round(time.perf_counter() - started, 3),
+                rows=rows,
+            )
+
+    async def _handle_timed_out_model(self, writer, model_uuid, fingerprints=None):
+        """
+        A model read that ran past MODEL_TIMEOUT is unreachable; one cut short by the run's deadline is deferred.
+        Either way it is carried forward from the live tables.
+        """
+        if expired():
+            self.logger.warning("Deadline reached before model %s was read, carrying it forward", model_uuid)
+            await self._handle_unreachable_model(writer, model_uuid, fingerprints, outcome="deferred")
+        else:
+            self.logger.error("Timed out reading model %s after %ss", model_uuid, self.model_timeout)
+            await self._handle_unreachable_model(writer, model_uuid, fingerprints)
 
-    async def _handle_unreachable_model(self, writer, model_uuid):
+    async def _handle_unreachable_model(self, writer, model_uuid, fingerprints=None, outcome="unreachable", **fields):
+        metrics.record_model(model_uuid, outcome, **fields)
         try:
             await writer.write_unreachable_model(model_uuid)
         except Exception:
             self.logger.exception("Failed to repopulate model %s", model_uuid)
+            return
+        if fingerprints:
+            fingerprints.carry_forward(model_uuid)
 
     async def _get_clouds(self, controller):
         clouds = (await controller.clouds()).clouds.keys()
@@ -0,0 +1,55 @@
+import logging
+
+from domain.serialization import model_from_dict
+from readers.snapshot_reader import SnapshotReader
+
+
+class ReplayService:
+    def __init__(self):
+        self.logger = logging.getLogger("ReplayService")
+
+    async def run(self, snapshot: SnapshotReader, writer):
+        """
+        Feeds a snapshot into a writer exactly as CollectorService would have. A snapshot without its closing
+        finalize record (an interrupted capture) is written but not finalized. Returns True when finalized.
+        """
+        finalized = False
+        try:
+            await writer.prepare_controller(snapshot.controller_info())
+            models = 0
+            for record in snapshot.records():
+                kind = record.get("type")
+                if kind == "model":
+                    models += await self._write_model(writer, model_from_dict(record["model"]))
+                elif kind == "unreachable":
+                    await writer.write_unreachable_model(record["uuid"])
+                elif kind == "unchanged":
+                    await writer.write_unchanged_model(record["uuid"])
+                elif kind == "finalize":
+                    await writer.finalize_controller()
+                    finalized = True
+                else:
+                    self.logger.warning("Ignoring unknown snapshot record %s in %s", kind, snapshot.path)
+            if finalized:
+                self.logger.info("Replayed %d model(s) from %s", models, snapshot.path)
+            else:
+                self.logger.warning("Snapshot %s is incomplete, not finalizing", snapshot.path)
+        finally:
+            await writer.close()
+        return finalized
+
+    async def _write_model(self, writer, model):
+        """
+        Writes a model inside its own savepoint; one that fails is rolled back and carried forward from the live tables.
+        Returns the number of models written.
+        """
+        await writer.start_model()
+        try:
+            await writer.write_model(model)
+            await writer.commit_model()
+        except Exception:
+            await writer.rollback_model()
+            self.logger.exception("Failed to replay model %s, carrying it forward", model.uuid)
+            await writer.write_unreachable_model(model.uuid)
+            return 0
+        return 1
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import time
+from os import environ
+from typing import Dict, List, Optional
+
+from domain.models import ControllerConfig
+
+
+class Scheduler:
+    """
+    Plans a collection cycle within a time budget (APP_TIMEOUT, or the cycle timeout in daemon mode):
+
+    - controllers that were fast last time run first, so a slow or hung one delays as few others as possible;
+    - every controller run gets a deadline FINALIZE_RESERVE seconds before the end of the budget, after which
+      models not yet read are carried forward from the live tables and the run finalizes what it has;
+    - a controller that failed CIRCUIT_FAILURES times in a row is skipped for CIRCUIT_COOLDOWN seconds, then
+      tried once more.
+
+    Durations and failures are kept in memory across daemon cycles and, with SCHEDULER_STATE_FILE, across runs.
+    """
+    # Weight of the latest duration in a controller's moving average.
+    ALPHA = 0.3
+
+    def __init__(self, state_path=None, failure_threshold=None, cooldown=None, finalize_reserve=None):
+        self.logger = logging.getLogger("Scheduler")
+        self.state_path = state_path or environ.get("SCHEDULER_STATE_FILE")
+        self.failure_threshold = max(1, int(failure_threshold or environ.get("CIRCUIT_FAILURES", "3")))
+        self.cooldown = float(cooldown or environ.get("CIRCUIT_COOLDOWN", "900"))
+        reserve = finalize_reserve if finalize_reserve is not None else environ.get("FINALIZE_RESERVE")
+        self.finalize_reserve = float(reserve) if reserve not in (None, "") else None
+        self.state: Dict[str, Dict] = self._load()
+
+    def _load(self):
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            self.logger.warning("Ignoring unreadable scheduler state %s", self.state_path)
+            return {}
+
+    def save(self):
+        if not self.state_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            temporary = f"{self.state_path}.tmp"
+            with open(temporary, "w") as file:
+                json.dump(self.state, file, sort_keys=True)
+            os.replace(temporary, self.state_path)
+        except OSError:
+            self.logger.exception("Failed to save scheduler state %s", self.state_path)
+
+    def deadline(self, budget: Optional[float], started: Optional[float] = None) -> Optional[float]:
+        """
+        The time.monotonic() by which controller runs should finalize: the end of the budget minus the finalize
+        reserve (10% of the budget unless FINALIZE_RESERVE is set).
+        """
+        if not budget:
+            return None
+        reserve = self.finalize_reserve if self.finalize_reserve is not None else budget / 10
+        return (started if started is not None else time.monotonic()) + max(0.0, budget - reserve)
+
+    def order(self, configs: List[ControllerConfig]) -> List[ControllerConfig]:
+        """
+        Fastest first by moving-average duration; controllers without history go first so they get measured.
+        """
+        return sorted(configs, key=lambda config: self.state.get(config.uuid, {}).get("seconds", 0.0))
+
+    def open_until(self, config: ControllerConfig) -> Optional[float]:
+        """
+        The wall-clock time until which the controller's circuit is open, or None if it may run now.
+        """
+        entry = self.state.get(config.uuid, {})
+        until = entry.get("open_until")
+        if entry.get("failures", 0) >= self.failure_threshold and until and until > time.time():
+            return until
+        return None
+
+    def record(self, config: ControllerConfig, ok: bool, seconds: float):
+        entry = self.state.setdefault(config.uuid, {})
+        if ok:
+            previous = entry.get("seconds")
+            entry["seconds"] = seconds if previous is None else self.ALPHA * seconds + (1 - self.ALPHA) * previous
+            entry["failures"] = 0
+            entry.pop("open_until", None)
+            return
+        entry["failures"] = entry.get("failures", 0) + 1
+        if entry["failures"] >= self.failure_threshold:
+            entry["open_until"] = time.time() + self.cooldown
+            self.logger.warning(
+                "Controller %s failed %d time(s) in a row, skipping it for %.0fs",
+                config.controller,
+                entry["failures"],
+                self.cooldown,
+            )
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from domain.models import ControllerConfig
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parses "i/n" (1-based, e.g. "2/3") into (i, n).
+    """
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}, expected i/n such as 1/3")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {value!r}, expected 1 <= i <= n")
+    return index, count
+
+
+def _hash(controller_uuid: str) -> int:
+    return int.from_bytes(hashlib.sha1(controller_uuid.encode()).digest()[:8], "big")
+
+
+def select_shard(configs: List[ControllerConfig], index: int, count: int) -> List[ControllerConfig]:
+    """
+    The controllers of shard `index` of `count`, by a stable hash of the controller UUID, so every process
+    given the same config agrees on the split and the shards never overlap.
+    """
+    return [config for config in configs if _hash(config.uuid) % count == index - 1]
+
+
+def subshard(shard: Optional[Tuple[int, int]], part: int, parts: int) -> Tuple[int, int]:
+    """
+    Splits `shard` (or everything, when None) into `parts` shards and returns the `part`-th (1-based).
+    Since h % (n * parts) determines h % n, these partition the outer shard exactly.
+    """
+    index, count = shard or (1, 1)
+    return index + count * (part - 1), count * parts
+
+
+class ControllerClaims:
+    """
+    Dynamic work claiming between collector processes, possibly on different hosts, through Postgres advisory locks.
+
+    A controller is claimed for a time window of the collection schedule (the daemon interval, or CLAIM_WINDOW for
+    single runs; workers should start together, e.g. from the same cron schedule) with pg_try_advisory_lock on a
+    key derived from the window and the controller UUID. Claims are session locks on one dedicated connection. If a
+    worker dies its session ends, its claims are released, and workers still polling pick the controllers up.
+
+    A worker marks each controller it has collected with a "done" lock, so the others stop polling for it, and holds
+    a shared "active" lock on the window while it works. A worker that has finished releases its shared lock and
+    waits until it can take the active lock exclusively, i.e. until every worker of the window has finished, and
+    then keeps it for CLAIM_START_SKEW seconds (default: 30) from the window's start: a worker started late within
+    that skew finds the window closed rather than the controllers unclaimed, and does not collect them again.
+
+    Every lock is taken by the task that entered the claims, on the connection it holds: `databases` gives each task
+    its own pooled connection, and a pooled connection drops its advisory locks when it goes back to the pool.
+    """
+    def __init__(self, db_url: str, window_seconds: float, poll_interval: Optional[float] = None):
+        # Only claiming needs the database; static sharding must not load its driver.
+        from db.database_manager import DatabaseManager
+        # A pool of its own, for the one connection that holds the locks.
+        self.database = DatabaseManager.create_database(db_url, concurrency=1)
+        self.window_seconds = max(1.0, float(window_seconds))
+        self.poll_interval = float(poll_interval or os.environ.get("CLAIM_POLL_INTERVAL", "10"))
+        self.start_skew = float(os.environ.get("CLAIM_START_SKEW", "30"))
+        self.window = None
+        self.connection = None
+
+    def key(self, config: Optional[ControllerConfig] = None, kind: str = "claim") -> int:
+        subject = config.uuid if config is not None else ""
+        digest = hashlib.sha1(f"juju-collector:{kind}:{self.window}:{subject}".encode()).digest()
+        return int.from_bytes(digest[:8], "big", signed=True)
+
+    async def __aenter__(self):
+        # Floored, so that a worker started late in the window still agrees with the others.
+        self.window = math.floor(time.time() / self.window_seconds)
+        if not self.database.is_connected:
+            await self.database.connect()
+        self.connection = self.database.connection()
+        await self.connection.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """
+        Releases the claims and returns the connection; the pool stays open for the next window until close().
+        """
+        from db import release_advisory_locks
+        try:
+            await release_advisory_locks(self.connection)
+        except Exception:
+            logger.warning("Failed to release controller claims", exc_info=True)
+        finally:
+            await self.connection.__aexit__(*exc_info)
+            self.connection = None
+
+    async def close(self):
+        if self.database.is_connected:
+            await self.database.disconnect()
+
+    async def try_claim(self, config: ControllerConfig) -> bool:
+        from db import try_advisory_lock
+        return await try_advisory_lock(self.connection, self.key(config))
+
+    async def done_elsewhere(self, config: ControllerConfig) -> bool:
+        """
+        Whether another worker has marked `config` as collected in this window.
+        """
+        from db import release_advisory_lock, try_advisory_lock
+        key = self.key(config, "done")
+        if await try_advisory_lock(self.connection, key):
+            await release_advisory_lock(self.connection, key)
+            return False
+        return True
+
+    async def _mark_done(self, finished, claimed):
+        """
+        Marks the controllers of the `finished` tasks that completed as collected, from the task holding the claims.
+        This waits rather than tries, since a worker checking done_elsewhere() holds the lock for a moment.
+        """
+        from db import advisory_lock
+        for task in finished:
+            if not task.cancelled() and task.exception() is None:
+                await advisory_lock(self.connection, self.key(claimed[task], "done"))
+
+    async def _wait_for_others(self, deadline: Optional[float]):
+        """
+        Waits, until `deadline` at most, for every worker of the window to finish, and then keeps the window closed
+        until CLAIM_START_SKEW seconds after its start.
+        """
+        from db import release_advisory_lock, try_advisory_lock
+        active = self.key(kind="active")
+        await release_advisory_lock(self.connection, active, shared=True)
+        while not await try_advisory_lock(self.connection, active):
+            if deadline is None or time.monotonic() >= deadline:
+                return
+            await asyncio.sleep(max(0.0, min(self.poll_interval, deadline - time.monotonic())))
+        hold = self.window * self.window_seconds + self.start_skew - time.time()
+        if deadline is not None:
+            hold = min(hold, deadline - time.monotonic())
+        if hold > 0:
+            await asyncio.sleep(hold)
+
+    async def run(self, configs: List[ControllerConfig], run_one, concurrency: int, deadline: Optional[float]):
+        """
+        Claims controllers in order, one free slot at a time, and runs each with `run_one`. Controllers claimed by
+        other workers are polled every CLAIM_POLL_INTERVAL seconds until they are marked done or `deadline` (a
+        time.monotonic()), in case their worker dies. Without a deadline nothing is polled or waited for.
+        Returns the results of `run_one` for the controllers this worker ran.
+        """
+        from db import try_advisory_lock
+        if not await try_advisory_lock(self.connection, self.key(kind="active"), shared=True):
+            logger.info("Every controller was collected by other workers in this window")
+            return []
+
+        pending = list(configs)
+        running = set()
+        # Our tasks, in start order, and the controller each runs.
+        claims = {}
+        while pending and (deadline is None or time.monotonic() < deadline):
+            if len(running) >= concurrency:
+                finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                await self._mark_done(finished, claims)
+                continue
+            claimed = None
+            for config in list(pending):
+                if await self.try_claim(config):
+                    claimed = config
+                    break
+                if await self.done_elsewhere(config):
+                    pending.remove(config)
+            if claimed is not None:
+                pending.remove(claimed)
+                task = asyncio.create_task(run_one(claimed), name=f"controller {claimed.controller}")
+                claims[task] = claimed
+                running.add(task)
+                continue
+            if not pending or deadline is None:
+                break
+            # Everything left is being collected elsewhere; wake early if one of ours finishes.
+            timeout = max(0.0, min(self.poll_interval, deadline - time.monotonic()))
+            if running:
+                finished, running = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                await self._mark_done(finished, claims)
+            else:
+                await asyncio.sleep(timeout)
+
+        skipped = len(configs) - len(claims)
+        if skipped:
+            logger.info("%d controller(s) collected by other workers", skipped)
+        while running:
+            finished, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            await self._mark_done(finished, claims)
+        results = await asyncio.gather(*claims)
+        await self._wait_for_others(deadline)
+        return results
+
+
+def _per_process_path(path: Optional[str], part: int) -> Optional[str]:
+    if not path:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}-{part}{extension}"
+
+
+def launch(processes: int, shard: Optional[Tuple[int, int]] = None, claim: bool = False) -> int:
+    """
+    Runs `processes` collector processes on this host (this script again), each taking a static subshard of
+    `shard` or, with `claim`, claiming controllers of `shard` dynamically. Metrics and scheduler state files get
+    a per-process suffix. SIGTERM/SIGINT are forwarded. Returns the highest exit code.
+    """
+    children = []
+    for part in range(1, processes + 1):
+        if claim:
+            args = ["--claim"] + (["--shard", "%d/%d" % shard] if shard else [])
+        else:
+            args = ["--shard", "%d/%d" % subshard(shard, part, processes)]
+        env = dict(os.environ, PROCESSES="1")
+        for name in ("METRICS_TEXTFILE", "METRICS_REPORT", "SCHEDULER_STATE_FILE", "PROFILE_DIR"):
+            if env.get(name):
+                env[name] = _per_process_path(env[name], part)
+        children.append(subprocess.Popen([sys.executable, sys.argv[0], *args], env=env))
+    logger.info("Started %d collector process(es)", len(children))
+
+    def forward(signum, frame):
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signum)
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, forward)
+    return max(child.wait() for child in children)
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from os import environ
+
+from juju.errors import JujuError
+
+from domain.models import ControllerConfig, ControllerInfo
+from readers.model_reader import ModelReader
+from readers.watch_reader import ModelWatcher
+from services.collector_service import CollectorService
+from util.metrics import current_controller, metrics
+
+
+class WatchService(CollectorService):
+    """
+    Event-driven collection for one controller. Every eligible model is kept connected and its AllWatcher deltas
+    are applied to an in-memory ModelState. Every WATCH_FLUSH_INTERVAL seconds, if anything changed, a new entry
+    is written in which only changed models are re-inserted and all others are carried forward server-side from
+    the live tables. Every WATCH_RECONCILE_INTERVAL seconds a full CollectorService.run catches any drift, and the
+    model list is refreshed so that new models are watched and removed ones dropped.
+    """
+    def __init__(self, flush_interval=None, reconcile_interval=None, **kwargs):
+        super().__init__(**kwargs)
+        self.flush_interval = float(flush_interval or environ.get("WATCH_FLUSH_INTERVAL", "60"))
+        self.reconcile_interval = float(reconcile_interval or environ.get("WATCH_RECONCILE_INTERVAL", "3600"))
+        self.flush_retries = max(0, int(environ.get("WATCH_WRITE_RETRIES", "3")))
+
+    async def watch(self, controller_config: ControllerConfig, make_writer, controllers, stop: asyncio.Event):
+        """
+        Runs until `stop` is set. `make_writer` is an async callable returning a fresh writer for each write cycle.
+        """
+        watchers = {}
+        # model UUID -> consecutive failed writes, see _flush.
+        failures = {}
+        last_reconcile = None
+        current_controller.set(controller_config.controller)
+        try:
+            while not stop.is_set():
+                try:
+                    controller = await controllers.get(controller_config)
+                    if last_reconcile is None or time.monotonic() - last_reconcile >= self.reconcile_interval:
+                        # Changes arriving during the full run mark their models dirty again; models watched for
+                        # the first time afterwards start dirty and are written on the next flush.
+                        for watcher in self._connected(watchers):
+                            watcher.state.dirty = False
+                        finalized = False
+                        try:
+                            finalized = await self.run(controller_config, await make_writer(), controllers)
+                        finally:
+                            if not finalized:
+                                for watcher in self._connected(watchers):
+                                    watcher.state.dirty = True
+                        await self._refresh_watchers(controller, controller_config, watchers)
+                        last_reconcile = time.monotonic()
+                    else:
+                        if len(self._connected(watchers)) < len(watchers):
+                            await self._refresh_watchers(controller, controller_config, watchers)
+                        if any(w.state.dirty for w in self._connected(watchers)):
+                            await self._flush(controller, controller_config, await make_writer(), watchers, failures)
+                except Exception:
+                    self.logger.exception("Watch cycle failed for controller %s", controller_config.controller)
+
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for watcher in self._connected(watchers):
+                await watcher.close()
+
+    @staticmethod
+    def _connected(watchers):
+        return [w for w in watchers.values() if w is not None and w.is_connected()]
+
+    async def _refresh_watchers(self, controller, controller_config, watchers):
+        """
+        Starts watchers for new or disconnected models and drops removed ones. Models that cannot be
+        connected to are kept as None so that flushes repopulate them instead of dropping them.
+        """
+        model_uuids = await self._list_models(controller)
+        for model_uuid in set(watchers) - set(model_uuids):
+            watcher = watchers.pop(model_uuid)
+            if watcher is not None:
+                await watcher.close()
+        for model_uuid in model_uuids:
+            watcher = watchers.get(model_uuid)
+            if watcher is not None and watcher.is_connected():
+                continue
+            if watcher is not None:
+                await watcher.close()
+            try:
+                model = await asyncio.wait_for(controller.get_model(model_uuid), timeout=self.model_timeout)
+                watchers[model_uuid] = ModelWatcher(model, controller_config.uuid)
+            except (JujuError, asyncio.TimeoutError):
+                self.logger.error("Failed to watch model %s", model_uuid)
+                watchers[model_uuid] = None
+        self.logger.info(
+            "Watching %d of %d model(s) on %s", len(self._connected(watchers)), len(watchers), controller_config.controller
+        )
+
+    async def _flush(self, controller, controller_config, writer, watchers, failures):
+        """
+        Writes an entry with the changed models re-inserted and the others carried forward. A model whose state
+        cannot be converted is not retried until its next change, since the same state would fail the same way;
+        one whose write fails is retried on the next WATCH_WRITE_RETRIES flushes, then left until its next change.
+        """
+        changed = [w for w in self._connected(watchers) if w.state.dirty]
+        written = []
+        try:
+            clouds = await self._get_clouds(controller)
+            await writer.prepare_controller(
+                ControllerInfo(name=controller_config.controller, uuid=controller_config.uuid, clouds=clouds)
+            )
+            for model_uuid, watcher in watchers.items():
+                if watcher is None or not watcher.is_connected():
+                    await writer.write_unreachable_model(model_uuid)
+                    metrics.record_model(model_uuid, "unreachable")
+                elif watcher.state.dirty:
+                    watcher.state.dirty = False
+                    reader = ModelReader(None, controller_config.uuid, model_uuid, self.provider_types, self.ip_policy)
+                    try:
+                        model = watcher.state.to_model(reader)
+                    except Exception:
+                        self.logger.exception("Failed to convert model %s, carrying it forward until it changes", model_uuid)
+                        await writer.write_unreachable_model(model_uuid)
+                        metrics.record_model(model_uuid, "failed")
+                        continue
+                    try:
+                        await self._write_in_savepoint(writer, model)
+                    except Exception:
+                        self.logger.exception("Failed to write model %s, carrying it forward", model_uuid)
+                        self._retry_later(watcher, model_uuid, failures)
+                        await writer.write_unreachable_model(model_uuid)
+                        metrics.record_model(model_uuid, "failed")
+                    else:
+                        written.append(model_uuid)
+                        metrics.record_model(model_uuid, "written")
+                else:
+                    await writer.write_unchanged_model(model_uuid)
+                    metrics.record_model(model_uuid, "unchanged")
+            await writer.finalize_controller()
+            # Models whose buffered write was undone were carried forward; write them again on a later flush.
+            for model_uuid, _ in writer.take_failed_models():
+                metrics.update_model(model_uuid, "failed")
+                if model_uuid in written:
+                    written.remove(model_uuid)
+                    self._retry_later(watchers[model_uuid], model_uuid, failures)
+            for model_uuid in written:
+                failures.pop(model_uuid, None)
+            self.logger.info(
+                "Controller %s: wrote %d changed model(s), carried forward %d",
+                controller_config.controller,
+                len(written),
+                len(watchers) - len(written),
+            )
+        except Exception:
+            for watcher in changed:
+                watcher.state.dirty = True
+            self.logger.exception("Failed to write changes for controller %s", controller_config.controller)
+        finally:
+            await writer.close()
+
+    def _retry_later(self, watcher, model_uuid, failures):
+        failures[model_uuid] = failures.get(model_uuid, 0) + 1
+        if failures[model_uuid] <= self.flush_retries:
+            watcher.state.dirty = True
+        else:
+            self.logger.error(
+                "Model %s failed to write %d time(s) in a row, waiting for its next change", model_uuid, failures[model_uuid]
+            )
+            failures.pop(model_uuid)
@@ -0,0 +1,155 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from logging import getLogger
+from os import environ
+from typing import Optional
+
+from util.metrics import metrics
+
+logger = getLogger(__name__)
+
+
+class AdaptiveLimiter:
+    """
+    An asyncio.Semaphore stand-in whose limit adapts to how the controller copes, AIMD-style (as in TCP congestion
+    control): every `limit` successful calls raise the limit by one, and a failed call or congestion halves it, at most once per
+    smoothed latency (about one round of calls). The limit stays between `floor` and `ceiling`.
+
+    Congestion is the median of the last WINDOW calls' latencies, each relative to its baseline, exceeding ADAPTIVE_LATENCY_FACTOR,
+    so a single slow call, e.g. for a large model, does not count. A call's baseline is the model's own when it has been read before
+    (the limiter is kept across daemon cycles), else the controller's, the lowest median latency seen. Baselines drift up towards
+    slower calls, so that a lasting change, such as models growing, becomes the new normal rather than permanent congestion.
+
+    Slots are granted first come, first served, like asyncio.Semaphore, which the collector's in-order consumers rely on.
+    """
+    # Weight of the latest sample in the smoothed latency.
+    ALPHA = 0.2
+    # Calls whose median latency ratio decides congestion.
+    WINDOW = 5
+    # How far a baseline moves towards a slower call: the controller's per call, a model's per read of that model.
+    DRIFT = 0.05
+    MODEL_DRIFT = 0.5
+
+    def __init__(self, name: str, initial: int, floor: int, ceiling: int, latency_factor: Optional[float] = None):
+        self.name = name
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.limit = float(min(max(initial, self.floor), self.ceiling))
+        self.latency_factor = float(latency_factor or environ.get("ADAPTIVE_LATENCY_FACTOR", "2"))
+        self.in_flight = 0
+        self.waiters = deque()
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self.model_baselines = {}
+        self.recent = deque(maxlen=self.WINDOW)
+        self.ratios = deque(maxlen=self.WINDOW)
+        self.last_decrease = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.slow = 0
+
+    @classmethod
+    def from_env(cls, name: str, initial: int) -> Optional["AdaptiveLimiter"]:
+        """
+        A limiter per ADAPTIVE_CONCURRENCY, MODEL_CONCURRENCY_MIN and MODEL_CONCURRENCY_MAX, or None when disabled.
+        """
+        if not environ.get("ADAPTIVE_CONCURRENCY"):
+            return None
+        floor = int(environ.get("MODEL_CONCURRENCY_MIN", "1"))
+        ceiling = int(environ.get("MODEL_CONCURRENCY_MAX", str(max(16, initial))))
+        return cls(name, initial, floor, ceiling)
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as we were cancelled; hand it on.
+                self.release()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+    @classmethod
+    def _drift(cls, baseline: Optional[float], seconds: float, weight: float) -> float:
+        if baseline is None or seconds <= baseline:
+            return seconds
+        return baseline + weight * (seconds - baseline)
+
+    def record(self, seconds: Optional[float], ok: bool, key: Optional[str] = None):
+        """
+        Feeds back one controller call: its latency (None if it never completed), whether it succeeded and what it
+        read (the model UUID), whose own baseline is then used.
+        """
+        self.calls += 1
+        if seconds is not None:
+            self.latency = seconds if self.latency is None else self.ALPHA * seconds + (1 - self.ALPHA) * self.latency
+            reference = self.model_baselines.get(key) or self.baseline
+            if reference:
+                self.ratios.append(seconds / reference)
+            self.recent.append(seconds)
+            self.baseline = self._drift(self.baseline, statistics.median(self.recent), self.DRIFT)
+            if key is not None and ok:
+                self.model_baselines[key] = self._drift(self.model_baselines.get(key), seconds, self.MODEL_DRIFT)
+
+        ratio = statistics.median(self.ratios) if len(self.ratios) == self.WINDOW else None
+        congested = ok and ratio is not None and ratio > self.latency_factor
+        if not ok or congested:
+            self.errors += not ok
+            self.slow += congested
+            if congested:
+                # Halve again only on fresh evidence.
+                self.ratios.clear()
+            self._decrease("error" if not ok else f"calls {ratio:.1f}x slower than their baseline")
+        elif self.limit < self.ceiling:
+            previous = int(self.limit)
+            self.limit = min(self.ceiling, self.limit + 1 / previous)
+            if int(self.limit) != previous:
+                logger.debug("Controller %s: model concurrency %d -> %d", self.name, previous, int(self.limit))
+            self._wake()
+        metrics.set("model_concurrency_limit", int(self.limit))
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self.last_decrease < (self.latency or 0.0):
+            return
+        self.last_decrease = now
+        previous = int(self.limit)
+        self.limit = max(float(self.floor), self.limit / 2)
+        if int(self.limit) != previous:
+            logger.info("Controller %s: model concurrency %d -> %d (%s)", self.name, previous, int(self.limit), reason)
+
+    def reset_counts(self):
+        self.calls = self.errors = self.slow = 0
+
+    def summary(self) -> str:
+        latency = f"{self.latency:.2f}s" if self.latency is not None else "n/a"
+        return (
+            f"model concurrency {int(self.limit)} (range {self.floor}-{self.ceiling}), smoothed latency {latency}, "
+            f"{self.errors} error(s) and {self.slow} congestion signal(s) in {self.calls} call(s)"
+        )
@@ -1,6 +1,15 @@
+import asyncio
+import time
+from collections import OrderedDict
+from logging import getLogger
+from os import environ
+from typing import Optional
 
 from juju.controller import Controller
-from db.database_manager import DatabaseManager
+
+from util.metrics import metrics
+
+logger = getLogger(__name__)
 
 async def connect_to_juju(endpoint: str, username: str, password: str, cacert: str):
     c = Controller()
@@ -12,7 +21,127 @@ async def connect_to_juju(endpoint: str, username: str, password: str, cacert: s
     )
     return c
 
-async def connect_to_db(url=None, owner_id=None):
-    dbm = DatabaseManager(db_url=url, owner=owner_id)
+async def connect_to_db(url=None, owner_id=None, database=None):
+    # Imported here so that collecting to the console or to snapshots never loads the database driver.
+    from db.database_manager import DatabaseManager
+    dbm = DatabaseManager(db_url=url, owner=owner_id, database=database)
     entry_id = await dbm.connect()
     return dbm, entry_id
+
+
+async def close_model(model, model_uuid: str):
+    """
+    Disconnects a model (its websocket and AllWatcher). The disconnect is shielded, so a read cancelled by its
+    timeout still closes the connection, and failures are only logged.
+    """
+    try:
+        await asyncio.shield(model.disconnect())
+    except Exception:
+        logger.warning("Failed to disconnect from model %s", model_uuid, exc_info=True)
+    metrics.inc("model_connections_total", outcome="closed")
+
+
+class ModelConnections:
+    """
+    A bounded LRU of idle model connections, reused across daemon cycles instead of reconnecting to every model
+    each cycle. A pooled Model keeps its AllWatcher running, so its state is current when it is taken again, at
+    the cost of the memory and socket it holds while idle.
+
+    At most `size` are kept. Cycles read the models in the same order, so plain LRU eviction would always evict
+    the connection needed next and never reuse any; instead the least recently used connection is only evicted
+    once it has been idle for `max_idle` seconds (e.g. its model was removed), and until then new connections
+    are disconnected rather than pooled, so a pool smaller than the models still reuses the same `size` every cycle.
+    """
+    def __init__(self, size: int, max_idle: float):
+        self.size = max(1, size)
+        self.max_idle = max_idle
+        # model UUID -> (Model, time.monotonic() it was returned), least recently used first.
+        self.idle = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> Optional["ModelConnections"]:
+        """
+        A pool of MODEL_POOL_SIZE connections evictable after MODEL_POOL_IDLE seconds (default: twice
+        DAEMON_INTERVAL), or None (disconnect every model once read) when MODEL_POOL_SIZE is 0 or unset.
+        """
+        size = int(environ.get("MODEL_POOL_SIZE", "0"))
+        if size <= 0:
+            return None
+        max_idle = float(environ.get("MODEL_POOL_IDLE") or 2 * float(environ.get("DAEMON_INTERVAL") or "300"))
+        return cls(size, max_idle)
+
+    async def take(self, model_uuid: str):
+        """
+        The pooled connection to the model, removed from the pool, or None if there is none or it has dropped.
+        """
+        model, _ = self.idle.pop(model_uuid, (None, None))
+        if model is None:
+            return None
+        if not model.is_connected():
+            await close_model(model, model_uuid)
+            return None
+        metrics.inc("model_connections_total", outcome="reused")
+        return model
+
+    async def put(self, model_uuid: str, model):
+        now = time.monotonic()
+        if model_uuid not in self.idle and len(self.idle) >= self.size:
+            oldest_uuid, (oldest, since) = next(iter(self.idle.items()))
+            if now - since < self.max_idle:
+                await close_model(model, model_uuid)
+                return
+            del self.idle[oldest_uuid]
+            await close_model(oldest, oldest_uuid)
+        self.idle[model_uuid] = (model, now)
+        self.idle.move_to_end(model_uuid)
+
+    async def close(self):
+        while self.idle:
+            model_uuid, (model, _) = self.idle.popitem()
+            await close_model(model, model_uuid)
+
+
+class ControllerConnections:
+    """
+    Keeps one logged-in Controller per controller UUID across collection cycles.
+    A controller whose connection has dropped, or that was discarded after a failure, is reconnected on the next get().
+    With `models` (a ModelConnections), model connections are pooled too.
+    """
+    def __init__(self, models: Optional[ModelConnections] = None):
+        self.controllers = {}
+        self.models = models
+
+    async def get(self, controller_config):
+        controller = self.controllers.get(controller_config.uuid)
+        if controller is not None and controller.is_connected():
+            return controller
+        if controller is not None:
+            logger.info("Reconnecting to controller %s", controller_config.controller)
+            await self.discard(controller_config)
+        controller = await connect_to_juju(
+            controller_config.endpoint,
+            controller_config.username,
+            controller_config.password,
+            controller_config.cacert,
+        )
+        self.controllers[controller_config.uuid] = controller
+        return controller
+
+    async def discard(self, controller_config):
+        controller = self.controllers.pop(controller_config.uuid, None)
+        if controller is None:
+            return
+        try:
+            await controller.disconnect()
+        except Exception:
+            logger.warning("Failed to disconnect from controller %s", controller_config.controller, exc_info=True)
+
+    async def close(self):
+        if self.models is not None:
+            await self.models.close()
+        for uuid in list(self.controllers):
+            controller = self.controllers.pop(uuid)
+            try:
+                await controller.disconnect()
+            except Exception:
+                logger.warning("Failed to disconnect from controller %s", uuid, exc_info=True)
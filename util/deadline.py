@@ -0,0 +1,62 @@
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+from logging import getLogger
+from typing import Optional
+
+# The time.monotonic() by which the current task's controller run should be finalizing, if any.
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+logger = getLogger(__name__)
+
+
+def remaining(limit: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left before the current deadline, capped at `limit`. None when there is neither a deadline nor a limit.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return limit
+    left = max(0.0, deadline - time.monotonic())
+    return left if limit is None else min(limit, left)
+
+
+def expired() -> bool:
+    deadline = current_deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+async def with_deadline(awaitable, limit: Optional[float] = None):
+    """
+    Awaits with a timeout of `limit` seconds, shortened to the current deadline. Raises asyncio.TimeoutError at once,
+    without starting the awaitable, if the deadline has already passed.
+    """
+    timeout = remaining(limit)
+    if timeout is not None and timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise asyncio.TimeoutError()
+    return await asyncio.wait_for(awaitable, timeout=timeout)
+
+
+async def with_backoff(make_call, retries: int, retry_on, base: float = 1.0, cap: float = 30.0, what: str = "call"):
+    """
+    Calls `make_call()` and awaits the result, retrying up to `retries` times on `retry_on` exceptions with full-jitter
+    exponential backoff. Each attempt and each wait is bounded by the current deadline; once it has passed the last
+    error is raised.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await with_deadline(make_call())
+        except retry_on as e:
+            if attempt >= retries or expired():
+                raise
+            delay = random.uniform(0, min(cap, base * 2 ** attempt))
+            left = remaining()
+            if left is not None and delay >= left:
+                raise
+            attempt += 1
+            logger.warning("%s failed (%s), retry %d/%d in %.1fs", what, type(e).__name__, attempt, retries, delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,59 @@
+import json
+import os
+from logging import getLogger
+from typing import Dict, Optional
+
+logger = getLogger(__name__)
+
+
+class FingerprintStore:
+    """
+    Model fingerprints from the previous successful run of one controller, kept in <state_dir>/<controller_uuid>.json.
+    Fingerprints recorded during a run only replace the stored ones when save() is called after a successful finalize,
+    so the live tables always hold what the stored fingerprints describe. The state is local to the host, so collect
+    only uses it when this host collects every run of the controller, i.e. not with --shard or --claim.
+    """
+    def __init__(self, state_dir: str, controller_uuid: str):
+        self.path = os.path.join(state_dir, f"{controller_uuid}.json")
+        self.previous: Dict[str, str] = self._load()
+        self.current: Dict[str, str] = {}
+        self.counts = {"new": 0, "changed": 0, "unchanged": 0}
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable fingerprint state %s", self.path)
+            return {}
+
+    def check(self, model_uuid: str, fingerprint: str) -> bool:
+        """
+        Records the fingerprint for this run and returns True when it matches the previous run.
+        """
+        previous = self.previous.get(model_uuid)
+        self.current[model_uuid] = fingerprint
+        if previous is None:
+            self.counts["new"] += 1
+        elif previous != fingerprint:
+            self.counts["changed"] += 1
+        else:
+            self.counts["unchanged"] += 1
+        return previous == fingerprint
+
+    def discard(self, model_uuid: str):
+        self.current.pop(model_uuid, None)
+
+    def carry_forward(self, model_uuid: str):
+        previous: Optional[str] = self.previous.get(model_uuid)
+        if previous is not None:
+            self.current[model_uuid] = previous
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.current, file, sort_keys=True)
+        os.replace(temporary, self.path)
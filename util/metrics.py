@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# The controller the current task is collecting, used as the default `controller` label.
+current_controller: ContextVar[str] = ContextVar("current_controller", default="")
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+PREFIX = "juju_collector_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_STATEMENT_PATTERNS = [
+    re.compile(r"^(INSERT)\s+INTO\s+([\w.]+)", re.IGNORECASE),
+    re.compile(r"^(CALL)\s+([\w.]+)", re.IGNORECASE),
+    re.compile(r"^(SELECT)\s.*?\sFROM\s+([\w.]+)", re.IGNORECASE | re.DOTALL),
+    re.compile(r"^(CREATE\s+TEMP\s+TABLE)\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w.]+)", re.IGNORECASE),
+    re.compile(r"^(TRUNCATE|COPY|UPDATE|DELETE\s+FROM)\s+([\w.]+)", re.IGNORECASE),
+]
+
+
+def statement_label(query) -> str:
+    """
+    A low-cardinality name for a SQL statement, e.g. "INSERT temp_machine" or "CALL insert_juju_data".
+    """
+    text = str(query).strip()
+    for pattern in _STATEMENT_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return f"{match.group(1).split()[0].upper()} {match.group(2)}"
+    return text.split(None, 1)[0].upper() if text else "UNKNOWN"
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    An in-process registry of counters, gauges and duration histograms for one collection run, exported as a
+    Prometheus textfile (for node_exporter's textfile collector) and as a JSON run report with per-model detail.
+    Labels default to the controller of the current task (see current_controller).
+    """
+    def __init__(self):
+        # Called with (name, seconds, labels) for every observation while a Profiler is running.
+        self.listener = None
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.models: List[Dict] = []
+        self.controllers: List[Dict] = []
+
+    @staticmethod
+    def _labels(labels) -> Labels:
+        labels.setdefault("controller", current_controller.get())
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.counters[(name, self._labels(labels))] += value
+
+    def set(self, name: str, value: float, **labels):
+        self.gauges[(name, self._labels(labels))] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, self._labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+        if self.listener is not None:
+            self.listener(name, seconds, dict(key[1]))
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def phase(self, phase: str, **labels):
+        return self.timer("phase_seconds", phase=phase, **labels)
+
+    def record_model(self, model_uuid: str, outcome: str, **fields):
+        self.inc("models_total", outcome=outcome)
+        self.models.append({"controller": current_controller.get(), "model": model_uuid, "outcome": outcome, **fields})
+
+    def update_model(self, model_uuid: str, outcome: str):
+        """
+        Changes the outcome recorded for a model of the current controller, e.g. when a buffered write fails
+        after the model was recorded as written.
+        """
+        controller = current_controller.get()
+        for record in reversed(self.models):
+            if record["model"] == model_uuid and record["controller"] == controller:
+                if record["outcome"] != outcome:
+                    self.inc("models_total", -1, outcome=record["outcome"])
+                    if record["outcome"] == "written":
+                        self.inc("rows_written_total", -record.get("rows", 0))
+                    record["outcome"] = outcome
+                    self.inc("models_total", outcome=outcome)
+                return
+        self.record_model(model_uuid, outcome)
+
+    def record_controller(self, controller: str, outcome: str, seconds: float):
+        self.inc("controller_runs_total", controller=controller, outcome=outcome)
+        self.set("controller_run_seconds", seconds, controller=controller)
+        self.controllers.append({"controller": controller, "outcome": outcome, "seconds": round(seconds, 3)})
+
+    @staticmethod
+    def _format(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+    def prometheus_text(self) -> str:
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{PREFIX}{name}{self._format(labels)} {value:g}")
+        for (name, labels), value in sorted(self.gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{PREFIX}{name}{self._format(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{self._format(labels, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{self._format(labels)} {histogram.sum:g}")
+            lines.append(f"{PREFIX}{name}_count{self._format(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> Dict:
+        def keyed(items):
+            return [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(items)]
+
+        return {
+            "started": self.started,
+            "finished": time.time(),
+            "controllers": self.controllers,
+            "models": self.models,
+            "counters": keyed(self.counters.items()),
+            "gauges": keyed(self.gauges.items()),
+            "histograms": [
+                {"name": name, "labels": dict(labels), "count": h.count, "sum": round(h.sum, 6)}
+                for (name, labels), h in sorted(self.histograms.items(), key=lambda item: item[0])
+            ],
+        }
+
+    @staticmethod
+    def _write(path: str, content: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            file.write(content)
+        os.replace(temporary, path)
+
+    def export(self, textfile: Optional[str] = None, report_path: Optional[str] = None):
+        self.set("last_run_timestamp_seconds", time.time(), controller="")
+        self.set("run_seconds", time.time() - self.started, controller="")
+        if textfile:
+            self._write(textfile, self.prometheus_text())
+        if report_path:
+            self._write(report_path, json.dumps(self.report(), indent=2))
+
+
+metrics = Metrics()
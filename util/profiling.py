@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from logging import getLogger
+from os import environ
+from typing import Optional
+
+from util.metrics import current_controller, metrics
+
+logger = getLogger(__name__)
+
+# Phases that only aggregate other awaits; kept in the timeline but left out of the slowest-awaits report.
+AGGREGATE_PHASES = frozenset({"models"})
+
+
+class Profiler:
+    """
+    Profiles a whole collection run for `--profile DIR`:
+
+    - cpu.collapsed: the event loop thread sampled every PROFILE_INTERVAL seconds into collapsed stacks
+      (for flamegraph.pl or speedscope), rooted at the controller whose task was running, or "(event loop)"
+      when the loop was waiting for I/O;
+    - trace.json: every timed await (phases such as get_model, and each SQL statement) as Chrome trace events,
+      one process per controller and one thread per task, for chrome://tracing or Perfetto;
+    - report.txt: CPU samples per controller and the PROFILE_TOP slowest awaits.
+
+    Nothing is installed unless a Profiler is started, so runs without --profile pay nothing.
+    """
+    def __init__(self, directory: str, interval: Optional[float] = None, top: Optional[int] = None):
+        self.directory = directory
+        self.interval = float(interval or environ.get("PROFILE_INTERVAL", "0.005"))
+        self.top = int(top or environ.get("PROFILE_TOP", "25"))
+        self.stacks = defaultdict(int)
+        self.spans = deque(maxlen=int(environ.get("PROFILE_MAX_SPANS", "200000")))
+        self.slowest = []
+        # Task name -> controller, learnt from spans, for Pythons without Task.get_context (before 3.12).
+        self.task_controllers = {}
+        self.loop = None
+        self.thread_id = None
+        self.sampler = None
+        self.stopping = threading.Event()
+        self.started = None
+
+    @classmethod
+    def from_options(cls, directory: Optional[str]) -> Optional["Profiler"]:
+        return cls(directory) if directory else None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        metrics.listener = self._span
+        self.sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self.sampler.start()
+
+    async def run(self, awaitable):
+        """
+        Awaits `awaitable` on the loop being profiled, so samples can be attributed to its tasks.
+        """
+        self.loop = asyncio.get_running_loop()
+        return await awaitable
+
+    def stop(self):
+        self.stopping.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        metrics.listener = None
+        try:
+            self.write()
+        except OSError:
+            logger.exception("Failed to write profile to %s", self.directory)
+
+    def _sample(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self.loop) if self.loop is not None else None
+            root = self._task_controller(task) if task is not None else "(event loop)"
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack.append(root)
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def _task_controller(self, task) -> str:
+        context = task.get_context() if hasattr(task, "get_context") else None
+        controller = context.get(current_controller, "") if context is not None else ""
+        name = task.get_name()
+        if not controller and name.startswith("controller "):
+            controller = name[len("controller "):]
+        return controller or self.task_controllers.get(name) or "(no controller)"
+
+    def _span(self, name, seconds, labels):
+        task = asyncio.current_task()
+        task_name = task.get_name() if task is not None else "main"
+        controller = labels.get("controller") or "(no controller)"
+        if labels.get("controller"):
+            self.task_controllers[task_name] = controller
+        what = labels.get("statement") or labels.get("phase") or name
+        span = (time.perf_counter() - seconds - self.started, seconds, controller, task_name, name, what)
+        self.spans.append(span)
+        if labels.get("phase") in AGGREGATE_PHASES:
+            return
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (seconds, span))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, span))
+
+    def write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "cpu.collapsed"), "w") as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write(f"{stack} {count}\n")
+
+        with open(os.path.join(self.directory, "trace.json"), "w") as file:
+            json.dump({"traceEvents": self._trace_events()}, file)
+
+        samples = defaultdict(int)
+        for stack, count in self.stacks.items():
+            samples[stack.split(";", 1)[0]] += count
+        total = sum(samples.values()) or 1
+        lines = [f"CPU samples every {self.interval * 1000:g}ms, by controller:"]
+        for controller, count in sorted(samples.items(), key=lambda item: -item[1]):
+            lines.append(f"  {count:8d} {100 * count / total:5.1f}%  {controller}")
+        lines.append("")
+        lines.append(f"{len(self.slowest)} slowest awaits:")
+        for seconds, (start, _, controller, task, _, what) in sorted(self.slowest, key=lambda item: -item[0]):
+            lines.append(f"  {seconds:9.3f}s at {start:9.3f}s  {what:<32} {controller}  [{task}]")
+        report = "\n".join(lines) + "\n"
+        with open(os.path.join(self.directory, "report.txt"), "w") as file:
+            file.write(report)
+        logger.info("Wrote profile to %s\n%s", self.directory, report)
+
+    def _trace_events(self):
+        pids = {}
+        tids = {}
+        events = []
+        for start, seconds, controller, task, name, what in self.spans:
+            pid = pids.setdefault(controller, len(pids) + 1)
+            tid = tids.setdefault((pid, task), len(tids) + 1)
+            events.append({
+                "name": what,
+                "cat": name,
+                "ph": "X",
+                "ts": round(start * 1e6),
+                "dur": round(seconds * 1e6),
+                "pid": pid,
+                "tid": tid,
+            })
+        for controller, pid in pids.items():
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": controller}})
+        for (pid, task), tid in tids.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": task}})
+        return events
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import resource
+import stat
+import sys
+from logging import getLogger
+from os import environ
+from typing import Optional, Tuple
+
+from util.metrics import metrics
+
+logger = getLogger(__name__)
+
+
+def rss_bytes() -> Optional[int]:
+    """
+    The process's current resident set size, or None where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss_bytes() -> int:
+    """
+    The process's peak resident set size since it started (ru_maxrss is in KiB on Linux, bytes on macOS).
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def open_descriptors() -> Tuple[int, int]:
+    """
+    The number of open file descriptors and, of those, sockets (controller, model and database connections).
+    """
+    directory = "/proc/self/fd" if os.path.isdir("/proc/self/fd") else "/dev/fd"
+    descriptors = sockets = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0, 0
+    for name in names:
+        try:
+            mode = os.fstat(int(name)).st_mode
+        except (OSError, ValueError):
+            # Closed since listing, e.g. the descriptor listdir used.
+            continue
+        descriptors += 1
+        sockets += stat.S_ISSOCK(mode)
+    return descriptors, sockets
+
+
+class ResourceMonitor:
+    """
+    Samples the process's RSS and open sockets every RESOURCE_SAMPLE_INTERVAL seconds (default: 1) during a run,
+    and on stop() reports the run's peaks and the counts left at the end as gauges. Sockets still open at the end
+    of a one-shot run, or growing from cycle to cycle in daemon mode, point at leaked connections. Between samples
+    RSS can peak unseen, so the process's peak since it started (ru_maxrss) is reported too, as max_rss_bytes; where
+    /proc is not available, it is all the peak RSS there is.
+    """
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = float(interval or environ.get("RESOURCE_SAMPLE_INTERVAL", "1"))
+        self.peak_rss = 0
+        self.peak_sockets = 0
+        self.sampler = None
+
+    def sample(self) -> Tuple[int, int]:
+        rss = rss_bytes()
+        self.peak_rss = max(self.peak_rss, rss if rss is not None else max_rss_bytes())
+        descriptors, sockets = open_descriptors()
+        self.peak_sockets = max(self.peak_sockets, sockets)
+        return descriptors, sockets
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self.sampler = asyncio.create_task(self._run(), name="resource monitor")
+
+    async def stop(self):
+        if self.sampler is not None:
+            self.sampler.cancel()
+            try:
+                await self.sampler
+            except asyncio.CancelledError:
+                pass
+            self.sampler = None
+        descriptors, sockets = self.sample()
+        metrics.set("peak_rss_bytes", self.peak_rss, controller="")
+        metrics.set("max_rss_bytes", max_rss_bytes(), controller="")
+        metrics.set("peak_open_sockets", self.peak_sockets, controller="")
+        metrics.set("open_sockets", sockets, controller="")
+        metrics.set("open_fds", descriptors, controller="")
+        logger.info(
+            "Peak RSS %.1f MiB (%.1f MiB since start), peak %d open socket(s), %d socket(s) and %d descriptor(s) "
+            "open at the end",
+            self.peak_rss / 2 ** 20,
+            max_rss_bytes() / 2 ** 20,
+            self.peak_sockets,
+            sockets,
+            descriptors,
+        )
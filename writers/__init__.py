@@ -1,4 +1,38 @@
-from writers.console_writer import ConsoleWriter
-from writers.database_writer import DatabaseWriter
+from importlib import import_module
+from os import environ
 
-__all__ = ["ConsoleWriter", "DatabaseWriter"]
+# Imported on first use, so that runs writing to the console or snapshots never load the database driver.
+_EXPORTS = {
+    "ConsoleWriter": "writers.console_writer",
+    "CopyWriter": "writers.copy_writer",
+    "DatabaseWriter": "writers.database_writer",
+    "SnapshotWriter": "writers.snapshot_writer",
+    "make_database_writer": "writers.factory",
+}
+
+__all__ = [
+    "WRITERS",
+    "ConsoleWriter",
+    "CopyWriter",
+    "DatabaseWriter",
+    "SnapshotWriter",
+    "make_database_writer",
+    "writer_kind",
+]
+
+WRITERS = ("database", "snapshot", "console")
+
+
+def writer_kind():
+    kind = environ.get("WRITER", "database")
+    if kind not in WRITERS:
+        raise ValueError(f"Unknown writer {kind}, expected one of {WRITERS}")
+    return kind
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
@@ -53,14 +53,53 @@ class ConsoleWriter:
         else:
             self.logger.info("  Applications: none")
 
+    supports_streaming = True
+
+    async def begin_model(self, model: Model):
+        self.logger.info(
+            "Model: %s (%s) owner=%s cloud=%s",
+            model.name,
+            model.uuid,
+            model.owner,
+            model.cloud,
+        )
+
+    async def write_model_part(self, model: Model, application, machines):
+        for machine in sorted(machines, key=lambda m: m.ordinal):
+            self.logger.info(
+                "  Machine: ordinal=%s instance_id=%s ip=%s",
+                machine.ordinal,
+                machine.instance_id,
+                machine.ip,
+            )
+        self.logger.info(
+            "  Application: %s charm=%s subordinate=%s",
+            application.name,
+            application.charm,
+            application.subordinate,
+        )
+        for unit in sorted(application.units, key=lambda u: u.ordinal):
+            self.logger.info(
+                "    Unit: %s ordinal=%s machine_instance_id=%s",
+                unit.name,
+                unit.ordinal,
+                unit.machine_instance_id,
+            )
+
     async def write_unreachable_model(self, model_id: str):
         self.logger.info("Unreachable model: %s (repopulated from DB)", model_id)
 
+    async def write_unchanged_model(self, model_id: str):
+        self.logger.info("Unchanged model: %s (carried forward from DB)", model_id)
+
+    async def start_model(self):
+        return None
+
     async def commit_model(self):
         return None
 
     async def rollback_model(self):
-        return None
+        self.logger.info("Rolled back model")
 
     async def finalize_controller(self):
         return None
@@ -0,0 +1,110 @@
+from os import environ
+
+from db import copy_records, resolve_staged_units, setup_unit_stage
+from domain.models import ControllerInfo, Model
+from writers.database_writer import DatabaseWriter
+
+
+class CopyWriter(DatabaseWriter):
+    """
+    A DatabaseWriter that buffers rows across models and streams them into the temp tables with COPY,
+    flushing every COPY_FLUSH_ROWS rows and at finalize. Units are staged by natural key and their
+    application and machine ids are resolved server-side, so no ids travel back to the client.
+    """
+    def __init__(self, db_manager, entry_id: int, flush_rows=None):
+        super().__init__(db_manager, entry_id, write_mode="bulk")
+        self.flush_rows = int(flush_rows or environ.get("COPY_FLUSH_ROWS", "10000"))
+        self.models = []
+        self.machines = []
+        self.applications = []
+        self.units = []
+
+    # Rows are already buffered and streamed across models, so per-application streaming does not apply.
+    supports_streaming = False
+
+    @property
+    def buffered(self):
+        return len(self.models) + len(self.machines) + len(self.applications) + len(self.units)
+
+    async def prepare_controller(self, controller: ControllerInfo):
+        await super().prepare_controller(controller)
+        await setup_unit_stage(self.dbm.db)
+
+    async def write_model(self, model: Model):
+        self.models.append((model.uuid, model.name, model.owner, model.controller_uuid, model.cloud, self.entry_id))
+
+        ordinals = {}
+        seen = set()
+        for machine in sorted(model.machines.values(), key=lambda m: m.ordinal):
+            if machine.ordinal not in seen:
+                seen.add(machine.ordinal)
+                self.machines.append((model.uuid, machine.ordinal, machine.ip, machine.instance_id, self.entry_id))
+            ordinals[machine.instance_id] = machine.ordinal
+
+        for application in model.applications:
+            self.applications.append(
+                (model.uuid, application.name, application.charm, application.subordinate, self.entry_id)
+            )
+            for unit in application.units:
+                machine_ordinal = ordinals.get(unit.machine_instance_id)
+                if machine_ordinal is None:
+                    self.logger.warning(
+                        "Missing machine for unit %s in model %s",
+                        unit.name,
+                        model.uuid,
+                    )
+                    continue
+                self.units.append((model.uuid, unit.ordinal, unit.name, application.name, machine_ordinal))
+
+        if self.buffered >= self.flush_rows:
+            await self.flush()
+
+    async def flush(self):
+        """
+        Copies the buffered rows inside a savepoint. If the copy fails, it is rolled back and the buffered models
+        are carried forward from the live tables instead, leaving the controller's transaction usable; they are
+        reported through take_failed_models, since write_model already returned for them.
+        """
+        if not self.buffered:
+            return
+        await self._ensure_transaction()
+        db = self.dbm.db
+        await self.dbm.start_savepoint()
+        try:
+            await copy_records(db, "temp_model", ["uuid", "name", "owner", "controller", "cloud", "row_source"], self.models)
+            await copy_records(db, "temp_machine", ["model", "ordinal", "ip", "instance_id", "row_source"], self.machines)
+            await copy_records(db, "temp_application", ["model", "name", "charm", "subordinate", "row_source"], self.applications)
+            await copy_records(
+                db, "temp_unit_stage", ["model", "ordinal", "name", "application_name", "machine_ordinal"], self.units
+            )
+            if self.units:
+                await resolve_staged_units(db, self.entry_id)
+            await self.dbm.release_savepoint()
+        except Exception:
+            await self.dbm.rollback_savepoint()
+            self.logger.exception("Failed to copy %d model(s), carrying them forward", len(self.models))
+            self.repopulate.extend(model[0] for model in self.models)
+            self.failed_models.extend((model[0], True) for model in self.models)
+        else:
+            self.logger.info(
+                "Copied %d model(s), %d machine(s), %d application(s), %d unit(s)",
+                len(self.models),
+                len(self.machines),
+                len(self.applications),
+                len(self.units),
+            )
+        self.models, self.machines, self.applications, self.units = [], [], [], []
+
+    # Rows are buffered across models, so savepoints wrap each flush (see flush) rather than each model.
+    async def start_model(self):
+        return None
+
+    async def commit_model(self):
+        return None
+
+    async def rollback_model(self):
+        return None
+
+    async def finalize_controller(self):
+        await self.flush()
+        await super().finalize_controller()
@@ -1,24 +1,44 @@
 import logging
+from os import environ
 
 from db import (
+    ingest_juju_model,
     insert_application,
+    insert_applications,
     insert_clouds,
     insert_controller,
     insert_juju_data,
     insert_machine,
+    insert_machines,
     insert_model,
     insert_unit,
-    populate_unreachable_model,
+    insert_units,
+    populate_unreachable_models,
     setup_juju_temp_tables_v1,
 )
 from domain.models import ControllerInfo, Model
 
 
 class DatabaseWriter:
-    def __init__(self, db_manager, entry_id: int):
+    WRITE_MODES = ("bulk", "json", "row")
+
+    # Finalizing updates the live tables, which unchanged models are carried forward from, so model fingerprints
+    # can be kept across runs (see FingerprintStore). Writers without this attribute never reach the live tables.
+    supports_fingerprints = True
+
+    def __init__(self, db_manager, entry_id: int, write_mode=None):
         self.dbm = db_manager
         self.entry_id = entry_id
         self.logger = logging.getLogger("DatabaseWriter")
+        self.write_mode = write_mode or environ.get("DB_WRITE_MODE", "bulk")
+        if self.write_mode not in self.WRITE_MODES:
+            raise ValueError(f"Unknown write mode {self.write_mode}, expected one of {self.WRITE_MODES}")
+        self.ingest_version = None
+        self.repopulate_chunk = max(1, int(environ.get("REPOPULATE_CHUNK_SIZE", "100")))
+        self.repopulate = []
+        # (model UUID, carried forward) for models whose write was undone after it was reported as done, see take_failed_models.
+        self.failed_models = []
+        self.stream_machine_ids = {}
 
     async def _ensure_transaction(self):
         if not self.dbm.transaction:
@@ -29,11 +49,89 @@ class DatabaseWriter:
         await setup_juju_temp_tables_v1(self.dbm.db)
         await insert_clouds(self.dbm.db, self.entry_id, controller.clouds)
         await insert_controller(self.dbm.db, self.entry_id, controller)
+        if self.write_mode == "json":
+            await self._negotiate_ingest()
+
+    async def _negotiate_ingest(self):
+        self.ingest_version = await self.dbm.best_procedure("ingest_juju_model")
+        if self.ingest_version is None:
+            self.logger.warning("No supported ingest_juju_model procedure, falling back to bulk inserts")
+            self.write_mode = "bulk"
+        else:
+            self.logger.info("Using ingest_juju_model_v%s", self.ingest_version)
 
     async def write_model(self, model: Model):
         await self._ensure_transaction()
+        if self.write_mode == "json":
+            await ingest_juju_model(self.dbm.db, self.entry_id, model, self.ingest_version)
+            return
         await insert_model(self.dbm.db, self.entry_id, model)
+        if self.write_mode == "bulk":
+            await self._write_model_bulk(model)
+        else:
+            await self._write_model_rows(model)
+
+    async def _write_model_bulk(self, model: Model):
+        """
+        Writes machines, applications and units with one statement per table (per BULK_CHUNK_SIZE rows),
+        mapping returned ids back by (model, ordinal) and (model, name).
+        """
+        machines = sorted(model.machines.values(), key=lambda m: m.ordinal)
+        machine_ids = await insert_machines(self.dbm.db, self.entry_id, model.uuid, machines)
+        instance_ids = {
+            machine.instance_id: machine_ids.get(machine.ordinal) for machine in machines
+        }
+        application_ids = await insert_applications(self.dbm.db, self.entry_id, model.uuid, model.applications)
 
+        units = []
+        for application in model.applications:
+            for unit in application.units:
+                machine_id = instance_ids.get(unit.machine_instance_id)
+                if not machine_id:
+                    self.logger.warning(
+                        "Missing machine for unit %s in model %s",
+                        unit.name,
+                        model.uuid,
+                    )
+                    continue
+                units.append((unit, application_ids[application.name], machine_id))
+        await insert_units(self.dbm.db, self.entry_id, units)
+
+    @property
+    def supports_streaming(self):
+        return self.write_mode != "json"
+
+    async def begin_model(self, model: Model):
+        """
+        Starts a streamed model write (see ModelReader.stream); `model` is the header without applications or machines.
+        """
+        await self._ensure_transaction()
+        await insert_model(self.dbm.db, self.entry_id, model)
+        self.stream_machine_ids = {}
+
+    async def write_model_part(self, model: Model, application, machines):
+        if machines:
+            machines = sorted(machines, key=lambda m: m.ordinal)
+            machine_ids = await insert_machines(self.dbm.db, self.entry_id, model.uuid, machines)
+            self.stream_machine_ids.update(
+                {machine.instance_id: machine_ids.get(machine.ordinal) for machine in machines}
+            )
+        application_ids = await insert_applications(self.dbm.db, self.entry_id, model.uuid, [application])
+
+        units = []
+        for unit in application.units:
+            machine_id = self.stream_machine_ids.get(unit.machine_instance_id)
+            if not machine_id:
+                self.logger.warning(
+                    "Missing machine for unit %s in model %s",
+                    unit.name,
+                    model.uuid,
+                )
+                continue
+            units.append((unit, application_ids[application.name], machine_id))
+        await insert_units(self.dbm.db, self.entry_id, units)
+
+    async def _write_model_rows(self, model: Model):
         instance_ids = {}
         for machine in sorted(model.machines.values(), key=lambda m: m.ordinal):
             machine_id = await insert_machine(self.dbm.db, self.entry_id, model.uuid, machine)
@@ -53,16 +151,67 @@ class DatabaseWriter:
                 await insert_unit(self.dbm.db, self.entry_id, unit, application_id, machine_id)
 
     async def write_unreachable_model(self, model_id: str):
+        """
+        Queues the model to be copied forward from the live tables; queued models are repopulated
+        together, REPOPULATE_CHUNK_SIZE at a time and at finalize.
+        """
+        self.repopulate.append(model_id)
+        if len(self.repopulate) >= self.repopulate_chunk:
+            await self.flush_repopulate()
+
+    async def write_unchanged_model(self, model_id: str):
+        """
+        Carries a model whose fingerprint matches the previous run forward from the live tables instead of re-inserting it.
+        """
+        await self.write_unreachable_model(model_id)
+
+    async def flush_repopulate(self):
+        """
+        Copies the queued models forward inside a savepoint, so a failed batch is rolled back on its own and the
+        controller's transaction stays usable. write_unreachable_model has already returned for the queued models,
+        so a failure is not raised to whichever call triggered the flush but reported for them through
+        take_failed_models.
+        """
+        if not self.repopulate:
+            return
+        queued, self.repopulate = self.repopulate, []
+        await self._ensure_transaction()
+        await self.dbm.start_savepoint()
+        try:
+            await populate_unreachable_models(self.dbm.db, queued, self.entry_id)
+            await self.dbm.release_savepoint()
+        except Exception:
+            await self.dbm.rollback_savepoint()
+            self.logger.exception("Failed to repopulate %d model(s): %s", len(queued), ", ".join(queued))
+            self.failed_models.extend((model_uuid, False) for model_uuid in queued)
+            return
+        self.logger.info("Repopulated %d model(s) from the live tables", len(queued))
+
+    def take_failed_models(self):
+        """
+        Returns and forgets the models whose write was undone after write_model returned, e.g. by a failed buffered
+        flush, as (model UUID, carried forward from the live tables instead) pairs.
+        """
+        failed, self.failed_models = self.failed_models, []
+        return failed
+
+    async def start_model(self):
+        """
+        Opens a savepoint for the next model's writes, so a failed model can be undone with rollback_model
+        without aborting the controller's transaction. Ended by commit_model or rollback_model.
+        """
         await self._ensure_transaction()
-        await populate_unreachable_model(self.dbm.db, model_id, self.entry_id)
+        await self.dbm.start_savepoint()
 
     async def commit_model(self):
-        await self.dbm.commit()
+        await self.dbm.release_savepoint()
 
     async def rollback_model(self):
-        await self.dbm.rollback()
+        self.stream_machine_ids = {}
+        await self.dbm.rollback_savepoint()
 
     async def finalize_controller(self):
+        await self.flush_repopulate()
         await self._ensure_transaction()
         await insert_juju_data(self.dbm.db, self.dbm.owner_id)
         await self.dbm.commit()
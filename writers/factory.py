@@ -0,0 +1,13 @@
+from os import environ
+
+from writers.copy_writer import CopyWriter
+from writers.database_writer import DatabaseWriter
+
+
+def make_database_writer(dbm, entry_id):
+    """
+    The database writer selected by DB_WRITE_MODE: CopyWriter for `copy`, otherwise DatabaseWriter in that mode.
+    """
+    if environ.get("DB_WRITE_MODE") == "copy":
+        return CopyWriter(dbm, entry_id)
+    return DatabaseWriter(dbm, entry_id)
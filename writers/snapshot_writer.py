@@ -0,0 +1,75 @@
+import gzip
+import itertools
+import json
+import logging
+import os
+import time
+from os import environ
+
+from domain.models import ControllerInfo, Model
+from domain.serialization import model_to_dict
+
+
+class SnapshotWriter:
+    """
+    Writes every record of a controller run to a new JSON Lines snapshot,
+    <SNAPSHOT_DIR>/<controller uuid>-<timestamp>-<pid>-<n>.jsonl, gzip-compressed (.jsonl.gz) when SNAPSHOT_COMPRESS
+    is set. The process id and a per-process counter keep runs started in the same second apart, and the file is
+    created exclusively, so two runs never write to the same one. Records are, in order: one "controller" record,
+    then "model", "unreachable" and "unchanged" records, and a closing "finalize" record. A snapshot can be replayed
+    into the database later with replay.py.
+    """
+    sequence = itertools.count(1)
+
+    def __init__(self, owner_id: int, directory=None, compress=None):
+        self.owner_id = owner_id
+        self.directory = directory or environ.get("SNAPSHOT_DIR", "snapshots")
+        self.compress = bool(compress if compress is not None else environ.get("SNAPSHOT_COMPRESS"))
+        self.path = None
+        self.file = None
+        self.logger = logging.getLogger("SnapshotWriter")
+
+    def _append(self, record: dict):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    async def prepare_controller(self, controller: ControllerInfo):
+        os.makedirs(self.directory, exist_ok=True)
+        suffix = ".jsonl.gz" if self.compress else ".jsonl"
+        name = f"{controller.uuid}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self.sequence)}{suffix}"
+        self.path = os.path.join(self.directory, name)
+        self.file = gzip.open(self.path, "xt") if self.compress else open(self.path, "x")
+        self._append({
+            "type": "controller",
+            "name": controller.name,
+            "uuid": controller.uuid,
+            "owner_id": self.owner_id,
+            "clouds": [cloud.name for cloud in controller.clouds],
+            "captured": time.time(),
+        })
+
+    async def write_model(self, model: Model):
+        self._append({"type": "model", "model": model_to_dict(model)})
+
+    async def write_unreachable_model(self, model_id: str):
+        self._append({"type": "unreachable", "uuid": model_id})
+
+    async def write_unchanged_model(self, model_id: str):
+        self._append({"type": "unchanged", "uuid": model_id})
+
+    async def start_model(self):
+        return None
+
+    async def commit_model(self):
+        return None
+
+    async def rollback_model(self):
+        return None
+
+    async def finalize_controller(self):
+        self._append({"type": "finalize"})
+        self.logger.info("Wrote snapshot %s", self.path)
+
+    async def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None